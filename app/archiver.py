@@ -0,0 +1,162 @@
+"""
+Moves soft-deleted rows out of the hot tenant tables.
+
+Rows soft-deleted longer than settings.ARCHIVE_GRACE_DAYS ago are moved from `resources` and
+`users` into `resources_archive` / `users_archive` of the same schema, in small transactions of
+settings.ARCHIVE_BATCH_SIZE rows with a pause between batches, so the archiver never holds
+locks or competes with request traffic for long.
+
+Users are only archived once nothing references them anymore (resources are archived first,
+and users that appear in audit logs stay so the audit trail keeps its user ids).
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, text
+
+from .config import settings
+from .database import db_session, engine, set_search_path
+from .models import Tenant, User, Resource
+from .sharding import get_shard_engine, validate_tenant_id
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for the advisory lock making sure only one archiver pass runs at a time
+ARCHIVER_LOCK_KEY = 727_029
+
+def _columns(table) -> str:
+    return ", ".join(c.name for c in table.columns)
+
+
+def ensure_archive_tables(schema_name: str, shard: str):
+    """Create users_archive / resources_archive in the tenant schema if missing.
+
+    Not cached: the schema may be dropped and recreated by another process at any time, and
+    CREATE TABLE IF NOT EXISTS is only a catalog lookup when the tables are there.
+    """
+    with get_shard_engine(shard).begin() as conn:
+        for table in ("users", "resources"):
+            # LIKE copies columns and NOT NULL constraints, but no defaults, indexes or foreign keys
+            conn.execute(text(
+                f'CREATE TABLE IF NOT EXISTS "{schema_name}".{table}_archive '
+                f'(LIKE "{schema_name}".{table}, archived_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE \'utc\'))'
+            ))
+
+
+def _move_sql(schema_name: str, table, extra_where: str = "") -> str:
+    cols = _columns(table)
+    return (
+        f'WITH moved AS ('
+        f' DELETE FROM "{schema_name}".{table.name} WHERE id IN ('
+        f'  SELECT id FROM "{schema_name}".{table.name} t'
+        f'  WHERE t.is_deleted = true AND t.deleted_at < :cutoff {extra_where}'
+        f'  ORDER BY t.deleted_at LIMIT :batch FOR UPDATE SKIP LOCKED)'
+        f' RETURNING {cols})'
+        # archived_at set explicitly: tables created before it was UTC have a local-time default
+        f' INSERT INTO "{schema_name}".{table.name}_archive ({cols}, archived_at)'
+        f" SELECT {cols}, now() AT TIME ZONE 'utc' FROM moved"
+    )
+
+
+def _move_in_batches(conn_engine, sql: str, cutoff: datetime, batch_size: int, pause: float) -> int:
+    total = 0
+    while True:
+        # One short transaction per batch
+        with conn_engine.begin() as conn:
+            moved = conn.execute(text(sql), {"cutoff": cutoff, "batch": batch_size}).rowcount
+        total += moved
+        if moved < batch_size:
+            return total
+        time.sleep(pause)
+
+
+def archive_tenant(
+    schema_name: str,
+    shard: str,
+    grace_days: Optional[float] = None,
+    batch_size: Optional[int] = None,
+    pause: Optional[float] = None,
+) -> dict:
+    """Archive soft-deleted rows of one tenant. Returns the number of rows moved per table."""
+    validate_tenant_id(schema_name)
+    grace_days = settings.ARCHIVE_GRACE_DAYS if grace_days is None else grace_days
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    pause = settings.ARCHIVE_BATCH_PAUSE_SECONDS if pause is None else pause
+    shard_engine = get_shard_engine(shard)
+    ensure_archive_tables(schema_name, shard)
+
+    # Rows soft-deleted before deleted_at existed start their grace period now
+    with shard_engine.begin() as conn:
+        for table in ("resources", "users"):
+            conn.execute(text(
+                f'UPDATE "{schema_name}".{table} SET deleted_at = now() AT TIME ZONE \'utc\' WHERE is_deleted = true AND deleted_at IS NULL'
+            ))
+
+    cutoff = datetime.utcnow() - timedelta(days=grace_days)
+    moved_resources = _move_in_batches(shard_engine, _move_sql(schema_name, Resource.__table__), cutoff, batch_size, pause)
+    user_refs = (
+        f'AND NOT EXISTS (SELECT 1 FROM "{schema_name}".resources r WHERE r.owner_id = t.id) '
+        f'AND NOT EXISTS (SELECT 1 FROM "{schema_name}".audit_logs a WHERE a.user_id = t.id)'
+    )
+    moved_users = _move_in_batches(shard_engine, _move_sql(schema_name, User.__table__, user_refs), cutoff, batch_size, pause)
+    return {"resources": moved_resources, "users": moved_users}
+
+
+def archive_all_tenants(grace_days: Optional[float] = None, batch_size: Optional[int] = None, pause: Optional[float] = None) -> dict:
+    """Run one archiver pass over every tenant; skipped if another process is already running one."""
+    results = {}
+    with engine.connect() as lock_conn:
+        locked = lock_conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": ARCHIVER_LOCK_KEY})
+        # The lock is session-level: end the transaction so this connection does not sit idle in it
+        lock_conn.commit()
+        if not locked:
+            print("Archiver pass already running elsewhere, skipping")
+            return results
+        try:
+            with db_session() as s:
+                set_search_path(s, settings.PUBLIC_SCHEMA)
+                tenants = s.execute(select(Tenant.schema_name, Tenant.shard).order_by(Tenant.id)).all()
+            for schema_name, shard in tenants:
+                try:
+                    results[schema_name] = archive_tenant(schema_name, shard, grace_days, batch_size, pause)
+                except Exception:
+                    # One broken tenant must not stop the pass for the others
+                    logger.exception("Archiving tenant '%s' failed", schema_name)
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ARCHIVER_LOCK_KEY})
+            lock_conn.commit()
+    return results
+
+
+class _ArchiverThread(threading.Thread):
+    def __init__(self):
+        super().__init__(name="soft-delete-archiver", daemon=True)
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.wait(settings.ARCHIVE_INTERVAL_SECONDS):
+            try:
+                archive_all_tenants()
+            except Exception:
+                logger.exception("Archiver pass failed")
+
+
+_archiver: Optional[_ArchiverThread] = None
+
+
+def start_background_archiver():
+    global _archiver
+    if _archiver is None or not _archiver.is_alive():
+        _archiver = _ArchiverThread()
+        _archiver.start()
+
+
+def stop_background_archiver():
+    global _archiver
+    if _archiver is not None:
+        _archiver.stopping.set()
+        _archiver.join(timeout=5)
+        _archiver = None
@@ -0,0 +1,262 @@
+"""
+Per-tenant change feed backed by PostgreSQL LISTEN/NOTIFY.
+
+crud.py mutations call notify_change(), which queues a pg_notify on the CHANGE_CHANNEL inside the
+mutation's transaction; PostgreSQL only delivers it once that transaction commits. Each process
+keeps one listener connection per shard and fans events out to its subscribers (SSE streams).
+
+SSE event ids are "<process epoch>-<sequence>", numbered by ChangeHub.publish() in the order this
+process receives the events. Audit log ids can't serve as ids: they are assigned at flush, so
+concurrent transactions commit (and are delivered) out of id order. The last
+CHANGE_FEED_BUFFER_SIZE events of every tenant are kept so a client reconnecting with
+Last-Event-ID gets the events it missed; when that is not possible (buffer too short, or the id
+comes from another worker process or an earlier run) it is told to refetch.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import uuid
+from collections import deque
+from typing import Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .sharding import get_shard_engine
+
+CHANGE_CHANNEL = "tenant_changes"
+# Prefix of this process' event ids: sequences of other processes (or runs) are not comparable
+_EPOCH = uuid.uuid4().hex[:12]
+
+logger = logging.getLogger(__name__)
+
+# ---------- Emitting ----------
+
+def notify_change(db: Session, entity: str, op: str, entity_id: int, event_id: int):
+    """Queue a change event for the tenant of `db` (delivered by PostgreSQL after commit)."""
+    db.execute(
+        text(
+            "SELECT pg_notify(:channel, json_build_object("
+            "'id', :event_id, 'tenant', current_schema(), 'entity', :entity, 'op', :op, 'entity_id', :entity_id"
+            ")::text)"
+        ),
+        {"channel": CHANGE_CHANNEL, "event_id": event_id, "entity": entity, "op": op, "entity_id": entity_id},
+    )
+
+# ---------- Subscribers ----------
+
+# Sentinel telling a subscriber it has to refetch state (fell behind or missed events)
+RESET = {"event": "reset"}
+
+
+class Subscriber:
+    """One client stream. Events are handed over from the listener thread to its event loop."""
+
+    def __init__(self, tenant: str, loop: asyncio.AbstractEventLoop):
+        self.tenant = tenant
+        self.loop = loop
+        # Bounded: a client that does not keep up is dropped instead of buffering without limit
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.CHANGE_FEED_QUEUE_SIZE)
+        self.closed = False
+
+    def offer(self, event: dict):
+        """Called from any thread."""
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event: dict):
+        if self.closed:
+            return
+        if self.queue.full():
+            # Slow client: drop what is queued and tell it to resync, then stop feeding it
+            self.closed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESET)
+            return
+        self.queue.put_nowait(event)
+
+
+class _TenantBuffer:
+    def __init__(self):
+        self.events: deque = deque(maxlen=settings.CHANGE_FEED_BUFFER_SIZE)
+        # Replay is complete for clients whose last sequence is >= covered_from
+        self.covered_from: Optional[int] = None
+
+    def append(self, event: dict):
+        if self.covered_from is None:
+            self.covered_from = event["seq"]
+        if len(self.events) == self.events.maxlen:
+            self.covered_from = max(self.covered_from, self.events[0]["seq"])
+        self.events.append(event)
+
+    def since(self, last_seq: int) -> Optional[list]:
+        """Events after last_seq, or None if some of them may have been missed."""
+        if self.covered_from is None or last_seq < self.covered_from:
+            return None
+        return [e for e in self.events if e["seq"] > last_seq]
+
+
+def parse_event_id(event_id: str) -> Optional[int]:
+    """Sequence number of one of this process' event ids, None for anything else."""
+    epoch, _, seq = event_id.partition("-")
+    if epoch != _EPOCH or not seq.isdigit():
+        return None
+    return int(seq)
+
+# ---------- Listener ----------
+
+class _ShardListener(threading.Thread):
+    """Holds a dedicated LISTEN connection for one shard and dispatches its notifications."""
+
+    def __init__(self, hub: "ChangeHub", shard: str):
+        super().__init__(name=f"change-feed-{shard}", daemon=True)
+        self.hub = hub
+        self.shard = shard
+        self.stopping = threading.Event()
+
+    def _connect(self):
+        raw = get_shard_engine(self.shard).raw_connection()
+        # Take the connection out of the pool: it stays in LISTEN mode for the life of the thread
+        raw.detach()
+        raw.dbapi_connection.autocommit = True
+        raw.cursor().execute(f"LISTEN {CHANGE_CHANNEL}")
+        return raw
+
+    def run(self):
+        backoff = 1.0
+        while not self.stopping.is_set():
+            try:
+                raw = self._connect()
+            except Exception:
+                logger.exception("Change feed listener for shard '%s' could not connect", self.shard)
+                self.stopping.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            backoff = 1.0
+            try:
+                conn = raw.dbapi_connection
+                while not self.stopping.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            self.hub.publish(json.loads(notify.payload))
+                        except (ValueError, KeyError):
+                            logger.warning("Ignoring malformed change event: %r", notify.payload)
+            except Exception:
+                logger.exception("Change feed listener for shard '%s' lost its connection", self.shard)
+                # Events may have been missed while reconnecting
+                self.hub.reset_shard(self.shard)
+            finally:
+                try:
+                    raw.close()
+                except Exception:
+                    pass
+
+
+class ChangeHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, set] = {}
+        self._buffers: Dict[str, _TenantBuffer] = {}
+        self._tenant_shards: Dict[str, str] = {}
+        self._listeners: Dict[str, _ShardListener] = {}
+        self._seq = 0
+
+    def _ensure_listener(self, shard: str):
+        listener = self._listeners.get(shard)
+        if listener is None or not listener.is_alive():
+            listener = _ShardListener(self, shard)
+            self._listeners[shard] = listener
+            listener.start()
+
+    def subscribe(self, tenant: str, shard: str, last_event_id: Optional[str] = None) -> Subscriber:
+        """Register a stream for `tenant`; events missed since last_event_id are queued first."""
+        sub = Subscriber(tenant, asyncio.get_running_loop())
+        with self._lock:
+            self._ensure_listener(shard)
+            self._tenant_shards[tenant] = shard
+            self._subscribers.setdefault(tenant, set()).add(sub)
+            if last_event_id is not None:
+                buffer = self._buffers.get(tenant)
+                last_seq = parse_event_id(last_event_id)
+                missed = buffer.since(last_seq) if buffer and last_seq is not None else None
+                for event in (missed if missed is not None else [RESET]):
+                    sub._put(event)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        sub.closed = True
+        with self._lock:
+            subs = self._subscribers.get(sub.tenant)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.tenant]
+
+    def publish(self, event: dict):
+        tenant = event["tenant"]
+        with self._lock:
+            # Delivery order, unlike the audit log id in event["id"]
+            self._seq += 1
+            event["seq"] = self._seq
+            # Only tenants that have been streamed by this process are buffered for resume
+            if tenant in self._tenant_shards:
+                self._buffers.setdefault(tenant, _TenantBuffer()).append(event)
+            subs = list(self._subscribers.get(tenant, ()))
+        for sub in subs:
+            sub.offer(event)
+
+    def reset_shard(self, shard: str):
+        """Forget buffered events of a shard's tenants and tell their subscribers to resync."""
+        with self._lock:
+            tenants = [t for t, s in self._tenant_shards.items() if s == shard]
+            subs = []
+            for tenant in tenants:
+                self._buffers.pop(tenant, None)
+                subs.extend(self._subscribers.get(tenant, ()))
+        for sub in subs:
+            sub.offer(RESET)
+
+    def stop(self):
+        with self._lock:
+            listeners = list(self._listeners.values())
+            self._listeners.clear()
+        for listener in listeners:
+            listener.stopping.set()
+        for listener in listeners:
+            listener.join(timeout=5)
+
+
+hub = ChangeHub()
+
+# ---------- SSE formatting ----------
+
+def format_sse(event: dict) -> str:
+    if event is RESET:
+        return "event: reset\ndata: {}\n\n"
+    payload = {k: event[k] for k in ("entity", "op", "entity_id")}
+    return f"id: {_EPOCH}-{event['seq']}\nevent: change\ndata: {json.dumps(payload)}\n\n"
+
+
+async def event_stream(sub: Subscriber, is_disconnected):
+    """Yield SSE frames for `sub` until the client goes away or falls behind."""
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), timeout=settings.CHANGE_FEED_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    return
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(event)
+            if event is RESET and sub.closed:
+                return
+    finally:
+        hub.unsubscribe(sub)
@@ -0,0 +1,198 @@
+"""
+Response compression (pure ASGI middleware).
+
+The encoding is negotiated from Accept-Encoding (q-values honoured, server preference
+zstd > br > gzip on ties). gzip is always available; zstd and br only when the optional
+`zstandard` / `brotli` packages are installed.
+
+Bodies are compressed as they stream through: nothing beyond the first
+settings.COMPRESSION_MIN_SIZE bytes is buffered (just enough to skip small responses).
+Chunks of at least settings.COMPRESSION_THREAD_MIN_SIZE bytes are compressed in a worker
+thread so large bodies (exports, big pages) do not stall the event loop.
+Server-sent events and already compressed media types are passed through untouched.
+"""
+import zlib
+from typing import Callable, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+from .config import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Content types never compressed: streams that must not be held back, and formats that are
+# already compressed (the tenant export is a tar of gzip members)
+UNCOMPRESSIBLE_TYPES = (
+    "text/event-stream",
+    "image/",
+    "audio/",
+    "video/",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-tar",
+    "application/zstd",
+    "application/octet-stream",
+)
+
+# (compress, finish) pair of one response's compressor
+Compressor = tuple[Callable[[bytes], bytes], Callable[[], bytes]]
+
+
+def _gzip() -> Compressor:
+    c = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+    return c.compress, c.flush
+
+
+def _brotli() -> Compressor:
+    c = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return c.process, c.finish
+
+
+def _zstd() -> Compressor:
+    c = zstandard.ZstdCompressor(level=settings.COMPRESSION_ZSTD_LEVEL).compressobj()
+    return c.compress, c.flush
+
+
+# Available encodings in server preference order
+ENCODERS: dict[str, Callable[[], Compressor]] = {}
+if zstandard is not None:
+    ENCODERS["zstd"] = _zstd
+if brotli is not None:
+    ENCODERS["br"] = _brotli
+ENCODERS["gzip"] = _gzip
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best available encoding for an Accept-Encoding header, or None for identity."""
+    qvalues = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues["gzip" if name == "x-gzip" else name] = q
+    best, best_q = None, 0.0
+    for encoding in ENCODERS:
+        q = qvalues.get(encoding, qvalues.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def is_compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "").lower()
+    return not content_type.startswith(UNCOMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            return await self.app(scope, receive, send)
+        # None: the client takes no encoding we have, responses still get Vary
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is not None and "http.response.pathsend" in scope.get("extensions", {}):
+            # FileResponse would hand the file to the server directly; make it send body messages
+            extensions = {k: v for k, v in scope["extensions"].items() if k != "http.response.pathsend"}
+            scope = {**scope, "extensions": extensions}
+        await _CompressingResponder(self.app, encoding)(scope, receive, send)
+
+
+async def _run(compress: Callable[[bytes], bytes], data: bytes) -> bytes:
+    """Compress `data`, off the event loop when it is large (zlib, brotli and zstd release the GIL)."""
+    if len(data) >= settings.COMPRESSION_THREAD_MIN_SIZE:
+        return await run_in_threadpool(compress, data)
+    return compress(data)
+
+
+class _CompressingResponder:
+    """Per-request state: holds the start message until the first body bytes decide whether to compress."""
+
+    def __init__(self, app, encoding: Optional[str]):
+        self.app = app
+        self.encoding = encoding
+        self.send = None
+        self.start = None
+        self.passthrough = False
+        self.buffer = b""
+        self.compress = self.finish = None
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self._send)
+
+    async def _send(self, message):
+        if self.passthrough:
+            return await self.send(message)
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            if not (200 <= message["status"] < 300) or message["status"] == 204 or not is_compressible(headers):
+                self.passthrough = True
+                return await self.send(message)
+            # Whether or not this one ends up compressed, the representation depends on Accept-Encoding
+            MutableHeaders(scope=message).add_vary_header("Accept-Encoding")
+            content_length = headers.get("content-length")
+            if self.encoding is None or (content_length is not None and int(content_length) < settings.COMPRESSION_MIN_SIZE):
+                self.passthrough = True
+                return await self.send(message)
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            return await self.send(message)
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compress is None:
+            # Still deciding: collect up to COMPRESSION_MIN_SIZE bytes
+            self.buffer += body
+            if more_body and len(self.buffer) < settings.COMPRESSION_MIN_SIZE:
+                return
+            if not more_body and len(self.buffer) < settings.COMPRESSION_MIN_SIZE:
+                self.passthrough = True
+                await self.send(self.start)
+                return await self.send({"type": "http.response.body", "body": self.buffer})
+            self.compress, self.finish = ENCODERS[self.encoding]()
+            headers = MutableHeaders(scope=self.start)
+            headers["Content-Encoding"] = self.encoding
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                # Same entity, different bytes
+                headers["ETag"] = "W/" + etag
+            body, self.buffer = self.buffer, b""
+            data = await _run(self.compress, body)
+            if not more_body:
+                data += self.finish()
+                headers["Content-Length"] = str(len(data))
+            else:
+                # Streamed with chunked transfer encoding
+                del headers["Content-Length"]
+            await self.send(self.start)
+            return await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        data = await _run(self.compress, body) if body else b""
+        if not more_body:
+            data += self.finish()
+        if data or not more_body:
+            await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
@@ -1,13 +1,29 @@
+from datetime import datetime
 from typing import Optional, List, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import select, func, update
 from .models import User, Resource, AuditLog, AuditAction, RoleEnum
 from .auth import hash_password
+from .change_feed import notify_change
+from .usage import record_usage
+from .invalidation import queue_invalidation
 
 # ---------- Utilities ----------
 
-def log_action(db: Session, user_id: Optional[int], action: AuditAction):
-    db.add(AuditLog(user_id=user_id, action=action))
+def log_action(db: Session, user_id: Optional[int], action: AuditAction) -> AuditLog:
+    entry = AuditLog(user_id=user_id, action=action)
+    db.add(entry)
+    db.flush()
+    return entry
+
+
+def log_change(db: Session, user_id: Optional[int], action: AuditAction, entity: str, op: str, entity_id: int):
+    """Audit a mutation, update the tenant usage counters, publish it on the change feed
+    (the audit id is the event id) and invalidate cached copies in every worker after commit."""
+    entry = log_action(db, user_id, action)
+    record_usage(db, entity, op)
+    notify_change(db, entity, op, entity_id, entry.id)
+    queue_invalidation(db, entity, db.info.get("tenant_id"), entity_id)
 
 # ---------- Users ----------
 
@@ -26,7 +42,7 @@ def create_user(db: Session, username: str, password: str, role: str, acting_use
     u = User(username=username, password_hash=hash_password(password), role=role)
     db.add(u)
     db.flush()
-    log_action(db, acting_user_id, AuditAction.CREATED_USER)
+    log_change(db, acting_user_id, AuditAction.CREATED_USER, "user", "created", u.id)
     return u
 
 
@@ -35,8 +51,9 @@ def soft_delete_user(db: Session, user_id: int, acting_user_id: int):
     if not user or user.is_deleted:
         raise ValueError("User not found")
     user.is_deleted = True
+    user.deleted_at = datetime.utcnow()
     db.flush()
-    log_action(db, acting_user_id, AuditAction.DELETED_USER)
+    log_change(db, acting_user_id, AuditAction.DELETED_USER, "user", "deleted", user.id)
 
 # ---------- Resources ----------
 
@@ -67,7 +84,7 @@ def create_resource(db: Session, name: str, description: Optional[str], owner_id
     r = Resource(name=name, description=description, owner_id=owner_id)
     db.add(r)
     db.flush()
-    log_action(db, acting_user_id, AuditAction.CREATED_RESOURCE)
+    log_change(db, acting_user_id, AuditAction.CREATED_RESOURCE, "resource", "created", r.id)
     return r
 
 
@@ -80,7 +97,7 @@ def update_resource(db: Session, resource_id: int, name: Optional[str], descript
     if description is not None:
         r.description = description
     db.flush()
-    log_action(db, acting_user_id, AuditAction.UPDATED_RESOURCE)
+    log_change(db, acting_user_id, AuditAction.UPDATED_RESOURCE, "resource", "updated", r.id)
     return r
 
 
@@ -89,8 +106,9 @@ def delete_resource(db: Session, resource_id: int, acting_user_id: int):
     if not r or r.is_deleted:
         raise ValueError("Resource not found")
     r.is_deleted = True
+    r.deleted_at = datetime.utcnow()
     db.flush()
-    log_action(db, acting_user_id, AuditAction.DELETED_RESOURCE)
+    log_change(db, acting_user_id, AuditAction.DELETED_RESOURCE, "resource", "deleted", r.id)
 
 # ---------- Search & Pagination ----------
 
@@ -1,10 +1,48 @@
 from contextlib import contextmanager
-from sqlalchemy import create_engine, text, inspect
+from sqlalchemy import create_engine, event, text, inspect
 from sqlalchemy.orm import sessionmaker, scoped_session
 from .config import settings
 
+def _reset_session_state(dbapi_connection, connection_record):
+    """Pool "checkin" hook: clear per-session state (search_path, SETs, advisory locks, LISTENs)
+    so the next checkout never inherits the previous tenant's schema."""
+    if dbapi_connection is None:
+        # Invalidated connection, nothing to reset
+        return
+    try:
+        # DISCARD ALL cannot run inside a transaction; autocommit also saves the BEGIN/COMMIT round trips
+        dbapi_connection.autocommit = True
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("DISCARD ALL")
+        finally:
+            cursor.close()
+        dbapi_connection.autocommit = False
+    except Exception as e:
+        # Broken connection: drop it instead of handing it out again
+        connection_record.invalidate(e)
+
+def create_db_engine(url: str):
+    """Create an engine with the configured pool sizing (used for the main database and every shard).
+
+    Liveness is checked by the background pool validator (app/pool.py) instead of a ping on
+    every checkout, unless DB_POOL_PRE_PING is enabled.
+    """
+    eng = create_engine(
+        url,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        future=True,
+    )
+    if settings.DB_POOL_RESET_ON_CHECKIN:
+        event.listen(eng, "checkin", _reset_session_state)
+    return eng
+
 # Create a synchronous engine
-engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True, future=True)
+engine = create_db_engine(settings.DATABASE_URL)
 
 # Session factory (one per request)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
@@ -26,44 +64,53 @@ def set_search_path(session, schema_name: str):
     """Set PostgreSQL search_path so that unqualified tables hit the tenant schema."""
     session.execute(text("SET search_path TO :schema, public").bindparams(schema=schema_name))
 
-def table_exists(table_name: str, schema_name: str = "public") -> bool:
-    """Check if a table exists in the specified schema"""
-    inspector = inspect(engine)
+def table_exists(table_name: str, schema_name: str = "public", bind=None) -> bool:
+    """Check if a table exists in the specified schema (on `bind`, default: main engine)"""
+    inspector = inspect(bind if bind is not None else engine)
     existing_tables = inspector.get_table_names(schema=schema_name)
     return table_name in existing_tables
 
 def create_all_tables():
-    """Create all tables in the public schema (Tenant table only) if they don't exist"""
-    from .models import Base, Tenant
+    """Create all tables in the public schema (Tenant registry and usage summary) if they don't exist"""
+    from .models import Base, Tenant, TenantUsage
     
     # Check if Tenant table already exists
     if table_exists("tenants", "public"):
         print("Public schema tables already exist")
+        # Registries created before sharding have no shard column: every tenant lives on the default shard
+        with engine.connect() as conn:
+            conn.execute(text(
+                f"ALTER TABLE public.tenants ADD COLUMN IF NOT EXISTS shard VARCHAR(50) NOT NULL DEFAULT '{settings.DEFAULT_SHARD}'"
+            ))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_tenants_shard ON public.tenants (shard)"))
+            conn.commit()
+        Base.metadata.create_all(bind=engine, tables=[TenantUsage.__table__])
         return
     
     print("Creating public schema tables...")
-    Base.metadata.create_all(bind=engine, tables=[Tenant.__table__])
+    Base.metadata.create_all(bind=engine, tables=[Tenant.__table__, TenantUsage.__table__])
     print("Public schema tables created successfully")
 
-def create_tenant_schema_tables(schema_name: str):
-    """Create tenant-specific schema and tables if they don't exist"""
+def create_tenant_schema_tables(schema_name: str, bind=None):
+    """Create tenant-specific schema and tables if they don't exist (on `bind`, default: main engine)"""
     from .models import Base, User, Resource, AuditLog
-    
+
+    bind = bind if bind is not None else engine
     # Check if schema exists and has tables
-    if table_exists("users", schema_name):
+    if table_exists("users", schema_name, bind=bind):
         print(f"Tenant schema '{schema_name}' tables already exist")
         return
     
     print(f"Creating tenant schema '{schema_name}' and tables...")
     
     # Create the schema first
-    with engine.connect() as conn:
+    with bind.connect() as conn:
         conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {schema_name}"))
         conn.commit()
 
     print(f"Schema '{schema_name}' created successfully!")
     # Create tables in the tenant schema
-    with engine.connect() as conn:
+    with bind.connect() as conn:
         # Set search path to the tenant schema
         conn.execute(text(f"SET search_path TO {schema_name}, public"))
         conn.commit()
@@ -76,8 +123,46 @@ def create_tenant_schema_tables(schema_name: str):
     
     print(f"Tenant schema '{schema_name}' and tables created successfully")
 
-def drop_tenant_schema(schema_name: str):
-    """Drop a tenant schema and all its tables"""
-    with engine.connect() as conn:
+# Columns added to tenant tables after their first release: (table, column, SQL type)
+TENANT_COLUMN_UPGRADES = [
+    ("users", "deleted_at", "TIMESTAMP WITHOUT TIME ZONE"),
+    ("resources", "deleted_at", "TIMESTAMP WITHOUT TIME ZONE"),
+]
+
+def upgrade_tenant_schema(schema_name: str, bind=None):
+    """Bring an existing tenant schema up to the current models (new columns and indexes)"""
+    from sqlalchemy.schema import CreateIndex
+    from .models import User, Resource, AuditLog
+
+    bind = bind if bind is not None else engine
+    with bind.connect() as conn:
+        conn.execute(text(f'SET search_path TO "{schema_name}", public'))
+        for table, column, sql_type in TENANT_COLUMN_UPGRADES:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {sql_type}"))
+        for table in (User.__table__, Resource.__table__, AuditLog.__table__):
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+        conn.commit()
+
+def upgrade_tenant_schemas(bind=None):
+    """Upgrade every tenant schema on `bind` that is missing the latest tenant columns"""
+    bind = bind if bind is not None else engine
+    table, column, _ = TENANT_COLUMN_UPGRADES[-1]
+    with bind.connect() as conn:
+        # One catalog query per database instead of inspecting every schema
+        outdated = conn.scalars(text(
+            "SELECT t.table_schema FROM information_schema.tables t "
+            "WHERE t.table_name = :table AND t.table_schema NOT IN ('public', 'information_schema', 'pg_catalog') "
+            "AND NOT EXISTS (SELECT 1 FROM information_schema.columns c "
+            "WHERE c.table_schema = t.table_schema AND c.table_name = :table AND c.column_name = :column)"
+        ), {"table": table, "column": column}).all()
+    for schema_name in outdated:
+        print(f"Upgrading tenant schema '{schema_name}'...")
+        upgrade_tenant_schema(schema_name, bind=bind)
+
+def drop_tenant_schema(schema_name: str, bind=None):
+    """Drop a tenant schema and all its tables (on `bind`, default: main engine)"""
+    bind = bind if bind is not None else engine
+    with bind.connect() as conn:
         conn.execute(text(f"DROP SCHEMA IF EXISTS {schema_name} CASCADE"))
         conn.commit()
@@ -13,6 +13,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app.database import create_all_tables, create_tenant_schema_tables, drop_tenant_schema, table_exists
 from app.models import Base, Tenant, User, Resource, AuditLog
 from app.config import settings
+from app.sharding import get_shard_engine, shard_names
 
 def check_table_status():
     """Check the status of all tables"""
@@ -45,17 +46,35 @@ def check_table_status():
     else:
         print("  Tenant Schemas: None found")
 
+def check_shard_status():
+    """Print the configured shards and how many tenants each one holds"""
+    from app.database import db_session, set_search_path
+    from sqlalchemy import select, func
+
+    with db_session() as s:
+        set_search_path(s, settings.PUBLIC_SCHEMA)
+        counts = dict(s.execute(select(Tenant.shard, func.count()).group_by(Tenant.shard)).all())
+    print("Shards:")
+    for name in shard_names():
+        print(f"  - {name}: {counts.get(name, 0)} tenant(s)")
+
 def main():
     """Main function for command-line usage"""
     if len(sys.argv) < 2:
         print("Usage: python db_utils.py [command] [schema_name]")
         print("Commands:")
         print("  create-public    - Create public schema tables (Tenant table)")
-        print("  create-tenant   - Create tenant schema and tables")
-        print("  drop-tenant     - Drop tenant schema and all tables")
+        print("  create-tenant   - Create tenant schema and tables [shard]")
+        print("  drop-tenant     - Drop tenant schema and all tables [shard]")
         print("  list-tables     - List all table names")
         print("  create-all      - Create all tables in public schema")
         print("  check-status    - Check status of all tables")
+        print("  check-shards    - List shards and tenant counts")
+        print("  export-tenant   - Export tenant to a COPY archive <schema_name> <archive.tar>")
+        print("  import-tenant   - Import a COPY archive as a new tenant <archive.tar> <schema_name> <tenant_name> [shard]")
+        print("  upgrade-tenants - Add new columns/indexes to existing tenant schemas on all shards")
+        print("  archive-deleted - Move soft-deleted rows past the grace period to archive tables [schema_name] [grace_days]")
+        print("  refresh-usage   - Recount the per-tenant usage summary [max_workers]")
         return
 
     command = sys.argv[1]
@@ -67,20 +86,22 @@ def main():
     elif command == "create-tenant":
         if len(sys.argv) < 3:
             print("Error: Please provide schema name")
-            print("Usage: python db_utils.py create-tenant <schema_name>")
+            print("Usage: python db_utils.py create-tenant <schema_name> [shard]")
             return
         schema_name = sys.argv[2]
-        print(f"Creating tenant schema '{schema_name}' and tables...")
-        create_tenant_schema_tables(schema_name)
+        shard = sys.argv[3] if len(sys.argv) > 3 else settings.DEFAULT_SHARD
+        print(f"Creating tenant schema '{schema_name}' and tables on shard '{shard}'...")
+        create_tenant_schema_tables(schema_name, bind=get_shard_engine(shard))
         
     elif command == "drop-tenant":
         if len(sys.argv) < 3:
             print("Error: Please provide schema name")
-            print("Usage: python db_utils.py drop-tenant <schema_name>")
+            print("Usage: python db_utils.py drop-tenant <schema_name> [shard]")
             return
         schema_name = sys.argv[2]
-        print(f"Dropping tenant schema '{schema_name}'...")
-        drop_tenant_schema(schema_name)
+        shard = sys.argv[3] if len(sys.argv) > 3 else settings.DEFAULT_SHARD
+        print(f"Dropping tenant schema '{schema_name}' on shard '{shard}'...")
+        drop_tenant_schema(schema_name, bind=get_shard_engine(shard))
         print(f"Tenant schema '{schema_name}' dropped successfully")
         
     elif command == "list-tables":
@@ -96,10 +117,71 @@ def main():
         
     elif command == "check-status":
         check_table_status()
+
+    elif command == "check-shards":
+        check_shard_status()
+
+    elif command == "export-tenant":
+        if len(sys.argv) < 4:
+            print("Error: Please provide schema name and archive path")
+            print("Usage: python db_utils.py export-tenant <schema_name> <archive.tar>")
+            return
+        from app.sharding import resolve_tenant_shard
+        from app.tenant_transfer import export_tenant
+        schema_name, archive_path = sys.argv[2], sys.argv[3]
+        print(f"Exporting tenant '{schema_name}' to '{archive_path}'...")
+        manifest = export_tenant(schema_name, resolve_tenant_shard(schema_name), archive_path)
+        for t in manifest["tables"]:
+            print(f"  - {t['table']}: {t['rows']} rows (sha256 {t['sha256'][:12]}...)")
+        print("Export completed")
+
+    elif command == "import-tenant":
+        if len(sys.argv) < 5:
+            print("Error: Please provide archive path, schema name and tenant name")
+            print("Usage: python db_utils.py import-tenant <archive.tar> <schema_name> <tenant_name> [shard]")
+            return
+        from app.database import db_session, set_search_path
+        from app.tenant_transfer import import_tenant
+        archive_path, schema_name, tenant_name = sys.argv[2], sys.argv[3], sys.argv[4]
+        shard = sys.argv[5] if len(sys.argv) > 5 else None
+        print(f"Importing '{archive_path}' as tenant '{schema_name}'...")
+        with db_session() as s:
+            set_search_path(s, settings.PUBLIC_SCHEMA)
+            t, manifest = import_tenant(s, archive_path, tenant_name, schema_name, shard=shard)
+            print(f"Tenant '{t.schema_name}' imported on shard '{t.shard}'")
+        for entry in manifest["tables"]:
+            print(f"  - {entry['table']}: {entry['rows']} rows verified")
+
+    elif command == "upgrade-tenants":
+        from app.database import upgrade_tenant_schemas
+        for shard in shard_names():
+            print(f"Upgrading tenant schemas on shard '{shard}'...")
+            upgrade_tenant_schemas(get_shard_engine(shard))
+        print("Tenant schemas are up to date")
+
+    elif command == "archive-deleted":
+        from app.archiver import archive_tenant, archive_all_tenants
+        from app.sharding import resolve_tenant_shard
+        schema_name = sys.argv[2] if len(sys.argv) > 2 else None
+        grace_days = float(sys.argv[3]) if len(sys.argv) > 3 else None
+        if schema_name:
+            print(f"Archiving soft-deleted rows of tenant '{schema_name}'...")
+            results = {schema_name: archive_tenant(schema_name, resolve_tenant_shard(schema_name), grace_days)}
+        else:
+            print("Archiving soft-deleted rows of all tenants...")
+            results = archive_all_tenants(grace_days)
+        for name, moved in results.items():
+            print(f"  - {name}: {moved['resources']} resources, {moved['users']} users archived")
+
+    elif command == "refresh-usage":
+        from app.usage import refresh_all_usage
+        max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        print("Refreshing tenant usage summary...")
+        print(f"Usage refreshed for {refresh_all_usage(max_workers)} tenant(s)")
         
     else:
         print(f"Unknown command: {command}")
-        print("Available commands: create-public, create-tenant, drop-tenant, list-tables, create-all, check-status")
+        print("Available commands: create-public, create-tenant, drop-tenant, list-tables, create-all, check-status, check-shards, export-tenant, import-tenant, upgrade-tenants, archive-deleted, refresh-usage")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
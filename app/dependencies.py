@@ -1,8 +1,9 @@
-from fastapi import Depends, Header, HTTPException
+from fastapi import Depends, Header
 from sqlalchemy.orm import Session
 from .database import db_session, set_search_path
 from .config import settings
 from .auth import get_current_claims
+from .sharding import tenant_session
 
 # Header name for tenant id
 TENANT_HEADER = "X-Tenant-ID"
@@ -17,13 +18,10 @@ def get_db_for_public():
 
 
 def get_db_for_tenant(tenant_id: str = Header(..., alias=TENANT_HEADER)):
-    # Ensure tenant header present; search_path is set to that schema
-    with db_session() as s:
-        # Validate schema name format quickly (alphanumeric and underscore)
-        print("tenant id:",tenant_id)
-        if not tenant_id or not tenant_id.replace("_", "").isalnum():
-            raise HTTPException(status_code=400, detail="Invalid tenant id")
-        set_search_path(s, tenant_id)
+    # Ensure tenant header present; the session is opened on the tenant's shard
+    # (validates the schema name) and search_path is set to that schema
+    print("tenant id:",tenant_id)
+    with tenant_session(tenant_id) as s:
         yield s
 
 
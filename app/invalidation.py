@@ -0,0 +1,272 @@
+"""
+Cache invalidation across worker processes.
+
+With several workers, a write only happens in one process while every process may cache what
+it touched (e.g. the tenant -> shard map in sharding.py). Mutations call queue_invalidation()
+on their session:
+
+  - "postgres" (settings.INVALIDATION_BUS): the event is sent with pg_notify inside the
+    mutation's own transaction (like change_feed.notify_change), so PostgreSQL delivers it to
+    the other workers exactly when the write commits and no extra connection is needed. Every
+    worker LISTENs on every shard, so the session may be bound to any of them.
+  - "local": in-memory, delivered to this process only (single worker, tests).
+
+Either way the publishing process applies its own events to its handlers right after commit.
+
+Events are {"scope": "tenant" | "user" | "resource", "tenant": schema_name, "id": int | None};
+a "tenant" event covers everything cached for that tenant and a "all" event means flush
+everything (handlers get it whatever scopes they registered for). Events of a scope without
+handlers are not queued at all.
+
+Staleness is bounded: each shard's listener pings the channel every INVALIDATION_HEARTBEAT_SECONDS
+and bus.fresh() turns False once any shard has been silent for INVALIDATION_MAX_STALENESS_SECONDS.
+Caches must not be read or filled while the bus is not fresh. Events may have been missed during
+a disconnect, so handlers get a flush ("all") when a listener loses or regains its connection.
+"""
+import json
+import logging
+import select
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "cache_invalidation"
+FLUSH = "all"
+SCOPES = ("tenant", "user", "resource")
+
+_PENDING_KEY = "pending_invalidations"
+
+InvalidationHandler = Callable[[dict], None]
+
+
+class LocalInvalidationBus:
+    """In-process bus: events only reach handlers of this process."""
+
+    def __init__(self):
+        # (handler, scopes it wants)
+        self._handlers: list[tuple[InvalidationHandler, frozenset]] = []
+
+    def register(self, handler: InvalidationHandler, scopes=SCOPES) -> InvalidationHandler:
+        unknown = set(scopes) - set(SCOPES)
+        if unknown:
+            raise ValueError(f"Unknown invalidation scopes: {', '.join(sorted(unknown))}")
+        self._handlers.append((handler, frozenset(scopes)))
+        return handler
+
+    def handles(self, scope: str) -> bool:
+        return any(scope in scopes for _, scopes in self._handlers)
+
+    def _deliver(self, events: list[dict]) -> bool:
+        """Hand `events` to the handlers; False if any of them failed."""
+        ok = True
+        for ev in events:
+            for handler, scopes in list(self._handlers):
+                if ev["scope"] != FLUSH and ev["scope"] not in scopes:
+                    continue
+                try:
+                    handler(ev)
+                except Exception:
+                    logger.exception("Invalidation handler failed for %r", ev)
+                    ok = False
+        return ok
+
+    def flush_all(self):
+        self._deliver([{"scope": FLUSH, "tenant": None, "id": None}])
+
+    def emit(self, session: Session, ev: dict):
+        """Send `ev` to the other processes as part of `session`'s transaction (nothing to do locally)."""
+
+    def deliver_committed(self, events: list[dict]) -> bool:
+        """Apply events of a committed transaction to this process' handlers."""
+        return self._deliver(events)
+
+    def mark_stale(self):
+        """Events may have been lost: caches must not be trusted until the bus recovers."""
+
+    def fresh(self) -> bool:
+        return True
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class _BusListener(threading.Thread):
+    """Holds one shard's LISTEN connection of a PostgresInvalidationBus and pings the channel."""
+
+    def __init__(self, bus: "PostgresInvalidationBus", shard: str):
+        super().__init__(name=f"invalidation-bus-{shard}", daemon=True)
+        self.bus = bus
+        self.shard = shard
+        self.stopping = threading.Event()
+
+    def _connect(self):
+        # Imported here: sharding registers its cache on this module's bus at import time
+        from .sharding import get_shard_engine
+
+        raw = get_shard_engine(self.shard).raw_connection()
+        # Take the connection out of the pool: it stays in LISTEN mode for the life of the thread
+        raw.detach()
+        raw.dbapi_connection.autocommit = True
+        raw.cursor().execute(f"LISTEN {CHANNEL}")
+        return raw
+
+    def run(self):
+        heartbeat = settings.INVALIDATION_HEARTBEAT_SECONDS
+        ping = json.dumps({"origin": self.bus.origin, "events": []})
+        backoff = 1.0
+        connected_before = False
+        while not self.stopping.is_set():
+            try:
+                raw = self._connect()
+            except Exception:
+                logger.exception("Invalidation bus could not connect to shard '%s'", self.shard)
+                self.stopping.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            backoff = 1.0
+            self.bus._heard(self.shard)
+            if connected_before:
+                # Anything published while we were away is lost
+                self.bus.flush_all()
+            connected_before = True
+            try:
+                conn = raw.dbapi_connection
+                next_ping = 0.0
+                while not self.stopping.is_set():
+                    now = time.monotonic()
+                    if now >= next_ping:
+                        # Goes through the LISTEN connection itself, so hearing it back proves the round trip
+                        raw.cursor().execute("SELECT pg_notify(%s, %s)", (CHANNEL, ping))
+                        next_ping = now + heartbeat
+                    if not self.bus._shard_fresh(self.shard):
+                        raise TimeoutError("no invalidation traffic within INVALIDATION_MAX_STALENESS_SECONDS")
+                    if select.select([conn], [], [], min(heartbeat, 1.0)) != ([], [], []):
+                        conn.poll()
+                    # Also drains notifications that arrived with the ping's result (the socket is not
+                    # readable for those)
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self.bus._heard(self.shard)
+                        try:
+                            payload = json.loads(notify.payload)
+                            if payload["origin"] != self.bus.origin and not self.bus._deliver(payload["events"]):
+                                self.bus.flush_all()
+                        except (ValueError, KeyError):
+                            logger.warning("Ignoring malformed invalidation event: %r", notify.payload)
+            except Exception:
+                if not self.stopping.is_set():
+                    logger.exception("Invalidation bus lost its connection to shard '%s'", self.shard)
+                    self.bus.flush_all()
+            finally:
+                try:
+                    raw.close()
+                except Exception:
+                    pass
+
+
+class PostgresInvalidationBus(LocalInvalidationBus):
+    """Bus shared by every process connected to the same shards (LISTEN/NOTIFY on each of them)."""
+
+    def __init__(self):
+        super().__init__()
+        # Identifies this bus' notifications, which it has already applied locally
+        self.origin = uuid.uuid4().hex
+        self._last_heard: Dict[str, float] = {}
+        self._listeners: Dict[str, _BusListener] = {}
+
+    def _heard(self, shard: str):
+        self._last_heard[shard] = time.monotonic()
+
+    def _shard_fresh(self, shard: str) -> bool:
+        heard = self._last_heard.get(shard)
+        return heard is not None and time.monotonic() - heard <= settings.INVALIDATION_MAX_STALENESS_SECONDS
+
+    def fresh(self) -> bool:
+        from .sharding import shard_names
+
+        # Also False before the listeners first connect (e.g. CLI scripts that never start the bus)
+        return all(self._shard_fresh(shard) for shard in shard_names())
+
+    def emit(self, session: Session, ev: dict):
+        # Whatever shard the session is on, every process LISTENs there
+        session.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": CHANNEL, "payload": json.dumps({"origin": self.origin, "events": [ev]})},
+        )
+
+    def mark_stale(self):
+        # The listeners see the bus is not fresh, reconnect and flush again
+        self._last_heard.clear()
+
+    def start(self):
+        from .sharding import shard_names
+
+        for shard in shard_names():
+            listener = self._listeners.get(shard)
+            if listener is None or not listener.is_alive():
+                listener = _BusListener(self, shard)
+                self._listeners[shard] = listener
+                listener.start()
+
+    def stop(self):
+        listeners = list(self._listeners.values())
+        self._listeners.clear()
+        for listener in listeners:
+            listener.stopping.set()
+        for listener in listeners:
+            listener.join(timeout=5)
+        self._last_heard.clear()
+
+
+if settings.INVALIDATION_BUS == "postgres":
+    bus = PostgresInvalidationBus()
+elif settings.INVALIDATION_BUS == "local":
+    bus = LocalInvalidationBus()
+else:
+    raise ValueError(f"Unknown INVALIDATION_BUS '{settings.INVALIDATION_BUS}' (expected 'postgres' or 'local')")
+
+# ---------- Publishing ----------
+
+def queue_invalidation(session: Session, scope: str, tenant: Optional[str], entity_id: Optional[int] = None):
+    """Invalidate cached copies in every process once `session` commits (nothing if it rolls back).
+
+    A no-op for scopes no cache has registered for.
+    """
+    if not bus.handles(scope):
+        return
+    ev = {"scope": scope, "tenant": tenant, "id": entity_id}
+    bus.emit(session, ev)
+    session.info.setdefault(_PENDING_KEY, []).append(ev)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending(session: Session):
+    events = session.info.pop(_PENDING_KEY, None)
+    if not events:
+        return
+    try:
+        ok = bus.deliver_committed(events)
+    except Exception:
+        logger.exception("Applying %d invalidation events failed", len(events))
+        ok = False
+    if not ok:
+        # Never keep serving from caches that may have missed a committed change
+        logger.warning("Invalidation failed, flushing all caches")
+        bus.mark_stale()
+        bus.flush_all()
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session: Session):
+    session.info.pop(_PENDING_KEY, None)
@@ -1,8 +1,11 @@
 from datetime import datetime
+from typing import Optional
 from sqlalchemy.orm import DeclarativeBase, relationship, Mapped, mapped_column
-from sqlalchemy import String, Integer, Boolean, DateTime, ForeignKey, Index, Enum as SAEnum
+from sqlalchemy import String, Integer, BigInteger, Boolean, DateTime, ForeignKey, Index, Enum as SAEnum
 from enum import Enum
 
+from .config import settings
+
 class Base(DeclarativeBase):
     pass
 
@@ -15,6 +18,23 @@ class Tenant(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String(100), unique=True, nullable=False)
     schema_name: Mapped[str] = mapped_column(String(100), unique=True, nullable=False)
+    # Name of the database shard holding this tenant's schema (see settings.SHARD_DATABASE_URLS)
+    shard: Mapped[str] = mapped_column(String(50), nullable=False, default=settings.DEFAULT_SHARD, server_default=settings.DEFAULT_SHARD)
+
+Index("ix_tenants_shard", Tenant.shard)
+
+class TenantUsage(Base):
+    __tablename__ = "tenant_usage"
+    # One row per tenant in the PUBLIC schema of the tenant's shard, kept up to date by crud.py
+    # in the same transaction as each mutation. Schema-qualified because it is written from
+    # tenant sessions whose search_path starts with the tenant schema.
+    __table_args__ = {"schema": "public"}
+
+    schema_name: Mapped[str] = mapped_column(String(100), primary_key=True)
+    user_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    resource_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    audit_count: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
 
 # ----------------------------
 # TENANT schema models (search_path driven)
@@ -33,10 +53,15 @@ class User(Base):
     password_hash: Mapped[str] = mapped_column(String(255), nullable=False)
     role: Mapped[str] = mapped_column(String(20), nullable=False)
     is_deleted: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    # Set on soft delete; rows deleted longer than the grace period are moved to users_archive
+    deleted_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
 
     # Unique username within a tenant achieved via unique index on username (per schema)
 
 Index("ix_users_username_unique", User.username, unique=True)
+# Partial indexes: live rows for the is_deleted == False queries, deleted rows for the archiver
+Index("ix_users_live_id", User.id, postgresql_where=User.is_deleted == False)
+Index("ix_users_deleted_at", User.deleted_at, postgresql_where=User.is_deleted == True)
 
 class Resource(Base):
     __tablename__ = "resources"
@@ -46,9 +71,16 @@ class Resource(Base):
     description: Mapped[str] = mapped_column(String(500), nullable=True)
     owner_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="RESTRICT"), nullable=False)
     is_deleted: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    deleted_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
 
 Index("ix_resources_name", Resource.name)
+# Both owner indexes are needed: the partial one serves the per-owner limit (live rows only), the
+# full one the checks that must see deleted resources too (the archiver's "user still referenced"
+# test and the ON DELETE RESTRICT check when it deletes a user). Deleted rows leave it once archived.
 Index("ix_resources_owner_id", Resource.owner_id)
+Index("ix_resources_live_id", Resource.id, postgresql_where=Resource.is_deleted == False)
+Index("ix_resources_live_owner_id", Resource.owner_id, postgresql_where=Resource.is_deleted == False)
+Index("ix_resources_deleted_at", Resource.deleted_at, postgresql_where=Resource.is_deleted == True)
 
 class AuditAction(str, Enum):
     CREATED_RESOURCE = "CREATED_RESOURCE"
@@ -66,3 +98,5 @@ class AuditLog(Base):
     timestamp: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
 
 Index("ix_audit_logs_timestamp", AuditLog.timestamp)
+# Lets the archiver check cheaply whether a deleted user is still referenced by audit logs
+Index("ix_audit_logs_user_id", AuditLog.user_id)
@@ -0,0 +1,148 @@
+"""
+Connection pool lifecycle: warm-up at startup, background validation and readiness.
+
+Engines come from database.create_db_engine(). Instead of pinging on every checkout
+(pool_pre_ping), a background thread pings the idle connections of every open pool each
+settings.DB_POOL_VALIDATE_INTERVAL_SECONDS and invalidates the dead ones. GET /ready reports
+the pools as ready once startup has warmed them and their last validation succeeded, so a
+rolling deploy only sends traffic to workers with open connections.
+"""
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from .config import settings
+from .sharding import get_shard_engine, open_shard_engines, shard_names
+
+logger = logging.getLogger(__name__)
+
+# shard -> {"ok": bool, "checked_at": epoch seconds, "error": str | None}
+_health: Dict[str, dict] = {}
+_warmed = threading.Event()
+
+
+def _record(shard: str, ok: bool, error: Optional[str] = None):
+    _health[shard] = {"ok": ok, "checked_at": time.time(), "error": error}
+
+# ---------- Warm-up ----------
+
+def warm_pool(eng, size: int) -> int:
+    """Open up to `size` connections in `eng`'s pool. Returns how many are pooled afterwards."""
+    # Only pool_size connections stay pooled (overflow ones are closed on check-in), and asking
+    # for more than pool_size + max_overflow would block until DB_POOL_TIMEOUT_SECONDS
+    size = min(size, eng.pool.size())
+    conns = []
+    try:
+        # Hold them all at once, otherwise the pool would hand back the same connection every time
+        for _ in range(size):
+            conns.append(eng.raw_connection())
+    finally:
+        for conn in conns:
+            conn.close()
+    return eng.pool.checkedin()
+
+
+def warm_all_pools():
+    """Pre-open connections on every configured shard (called on startup)."""
+    size = settings.DB_POOL_WARM_SIZE if settings.DB_POOL_WARM_SIZE is not None else settings.DB_POOL_SIZE
+    for shard in shard_names():
+        try:
+            opened = warm_pool(get_shard_engine(shard), size)
+            _record(shard, True)
+            print(f"Warmed connection pool of shard '{shard}' ({opened} connections)")
+        except Exception as e:
+            # Not ready until the validator manages to connect
+            logger.exception("Warming connection pool of shard '%s' failed", shard)
+            _record(shard, False, str(e))
+    _warmed.set()
+
+# ---------- Background validation ----------
+
+def validate_pool(eng) -> tuple[int, int]:
+    """Ping the idle connections of `eng`'s pool, invalidating the ones that fail.
+
+    Returns (pinged, failed). The pool is FIFO, so checking connections out one at a time
+    visits each idle one once. A pool with nothing open gets one new connection as a probe;
+    a pool whose connections are all busy is left alone (they are in use, hence alive).
+    """
+    pool = eng.pool
+    idle = pool.checkedin()
+    if idle == 0 and pool.checkedout() == 0:
+        idle = 1
+    failed = 0
+    for _ in range(idle):
+        conn = eng.raw_connection()
+        try:
+            eng.dialect.do_ping(conn.dbapi_connection)
+        except Exception as e:
+            failed += 1
+            conn.invalidate(e)
+        finally:
+            conn.close()
+    return idle, failed
+
+
+def validate_all_pools():
+    for shard, eng in open_shard_engines().items():
+        try:
+            pinged, failed = validate_pool(eng)
+            if failed:
+                print(f"Pool validation: dropped {failed}/{pinged} dead connections of shard '{shard}'")
+            if failed and failed == pinged:
+                # Every connection was dead (e.g. the database restarted): the second pass reconnects
+                # the invalidated ones, and raises if the database is still unreachable
+                validate_pool(eng)
+        except Exception as e:
+            _record(shard, False, str(e))
+            continue
+        _record(shard, True)
+
+
+class _PoolValidatorThread(threading.Thread):
+    def __init__(self):
+        super().__init__(name="pool-validator", daemon=True)
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.wait(settings.DB_POOL_VALIDATE_INTERVAL_SECONDS):
+            try:
+                validate_all_pools()
+            except Exception:
+                logger.exception("Pool validation failed")
+
+
+_validator: Optional[_PoolValidatorThread] = None
+
+
+def start_pool_validator():
+    global _validator
+    if _validator is None or not _validator.is_alive():
+        _validator = _PoolValidatorThread()
+        _validator.start()
+
+
+def stop_pool_validator():
+    global _validator
+    if _validator is not None:
+        _validator.stopping.set()
+        _validator.join(timeout=5)
+        _validator = None
+
+# ---------- Readiness ----------
+
+def pool_status() -> dict:
+    """Readiness report: per-shard pool counters plus the result of the last warm-up/validation."""
+    pools = {}
+    for shard, eng in open_shard_engines().items():
+        pool = eng.pool
+        health = _health.get(shard, {"ok": False, "checked_at": None, "error": "not checked yet"})
+        pools[shard] = {
+            **health,
+            "size": pool.size(),
+            "idle": pool.checkedin(),
+            "in_use": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+        }
+    ready = _warmed.is_set() and all(p["ok"] for p in pools.values())
+    return {"ready": ready, "warmed": _warmed.is_set(), "pools": pools}
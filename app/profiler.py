@@ -0,0 +1,312 @@
+"""
+On-demand sampling profiler for live workers.
+
+A background thread snapshots the Python stacks of all threads (sys._current_frames) every
+settings.PROFILER_INTERVAL_MS and aggregates them. Nothing runs unless a profile is requested:
+  - whole process for N seconds:  POST /debug/profile?seconds=N   (superadmin token)
+  - a single request:             X-Profile: collapsed|speedscope
+                                  X-Profile-Token: <superadmin token>
+                                  (the response body is replaced by the profile)
+
+A request profile only samples the event loop thread and the worker threads running that
+request's sync code (found through its contextvars context). The event loop is shared, so async
+code of concurrent requests can still show up there; the route tag tells them apart. Request
+profiles stop after settings.PROFILER_MAX_SECONDS, and streaming (SSE) responses are refused.
+
+Stacks are tagged with the tenant and route they belong to: the route comes from the endpoint
+function found on the stack, the tenant from the `db` session of that endpoint (tenant_session
+records it in Session.info). Output is either collapsed stacks ("a;b;c <count>", for
+flamegraph.pl / speedscope / inferno) or a speedscope JSON file.
+"""
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+import anyio
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from .auth import decode_token
+from .config import settings
+from .models import RoleEnum
+
+# Leaf frames of threads that are just waiting for work (worker pools, the event loop selector)
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+}
+# Background threads that are never interesting for request profiling
+IGNORED_THREAD_PREFIXES = ("change-feed-", "soft-delete-archiver", "pool-validator", "invalidation-bus", "usage-refresh", "sampling-profiler")
+
+FORMATS = ("collapsed", "speedscope")
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Marker of the request being profiled, inherited by the worker threads that run its sync code
+_profiled_request: contextvars.ContextVar = contextvars.ContextVar("profiled_request", default=None)
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _runs_request(frames: list, marker) -> bool:
+    """True if a thread's stack runs in the context of the request `marker`.
+
+    run_in_threadpool hands a copy of the request's context to the worker thread, which keeps it
+    as a local of one of its outermost frames (anyio's WorkerThread.run).
+    """
+    for frame in frames[:5]:
+        for value in frame.f_locals.values():
+            if isinstance(value, contextvars.Context) and value.get(_profiled_request) is marker:
+                return True
+    return False
+
+
+def _frame_label(code) -> str:
+    filename = code.co_filename
+    if filename.startswith(_ROOT):
+        filename = os.path.relpath(filename, _ROOT)
+    else:
+        filename = os.path.basename(filename)
+    # ';' separates frames in the collapsed format
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+def endpoint_routes(app) -> dict:
+    """Map endpoint code objects to "METHOD /path" labels."""
+    routes = {}
+    for route in getattr(app, "routes", []):
+        endpoint = getattr(route, "endpoint", None)
+        code = getattr(endpoint, "__code__", None)
+        if code is not None:
+            methods = ",".join(sorted(getattr(route, "methods", None) or ["ANY"]))
+            routes[code] = f"{methods} {route.path}"
+    return routes
+
+
+class SamplingProfiler:
+    def __init__(self, routes: dict, interval: Optional[float] = None, request=None):
+        self.routes = routes
+        self.interval = interval or settings.PROFILER_INTERVAL_MS / 1000
+        # (event loop thread ident, request marker) when profiling a single request
+        self.request = request
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self.started_at = 0.0
+        self.duration = 0.0
+
+    def _tags(self, frames: list) -> tuple[str, str]:
+        for frame in frames:
+            route = self.routes.get(frame.f_code)
+            if route is not None:
+                tenant = "-"
+                db = frame.f_locals.get("db")
+                if isinstance(db, Session):
+                    tenant = db.info.get("tenant_id", "-")
+                return tenant, route
+        return "-", "-"
+
+    def _sample(self, ignored: set):
+        for ident, frame in sys._current_frames().items():
+            if ident in ignored:
+                continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(frame)
+                frame = frame.f_back
+            frames.reverse()
+            if self.request is not None and ident != self.request[0] and not _runs_request(frames, self.request[1]):
+                continue
+            tenant, route = self._tags(frames)
+            stack = (f"tenant:{tenant}", f"route:{route}") + tuple(_frame_label(f.f_code) for f in frames)
+            self.stacks[stack] += 1
+        self.samples += 1
+
+    def _run(self):
+        ignored = {
+            t.ident for t in threading.enumerate()
+            if t.name.startswith(IGNORED_THREAD_PREFIXES)
+        }
+        next_at = time.perf_counter()
+        while not self._stop.is_set():
+            self._sample(ignored)
+            next_at += self.interval
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                next_at = time.perf_counter()
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+
+    # ---------- Output ----------
+
+    def collapsed(self) -> str:
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def speedscope(self, name: str) -> dict:
+        frame_index: dict = {}
+        frames, samples, weights = [], [], []
+        for stack, count in self.stacks.most_common():
+            indexes = []
+            for label in stack:
+                if label not in frame_index:
+                    frame_index[label] = len(frames)
+                    frames.append({"name": label})
+                indexes.append(frame_index[label])
+            samples.append(indexes)
+            weights.append(round(count * self.interval * 1000, 3))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "multi-tenant-fastapi-app sampling profiler",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(sum(weights), 3),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+    def render(self, fmt: str, name: str) -> tuple[bytes, str]:
+        """Profile bytes and media type for `fmt` ("collapsed" or "speedscope")."""
+        if fmt == "speedscope":
+            return json.dumps(self.speedscope(name)).encode(), "application/json"
+        return self.collapsed().encode(), "text/plain; charset=utf-8"
+
+
+# Only one profile per process at a time: concurrent samplers would just slow the worker down
+_profile_lock = threading.Lock()
+
+
+def start_profile(app, interval: Optional[float] = None, request=None) -> SamplingProfiler:
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        profiler = SamplingProfiler(endpoint_routes(app), interval, request)
+        profiler.start()
+    except Exception:
+        _profile_lock.release()
+        raise
+    return profiler
+
+
+def stop_profile(profiler: SamplingProfiler):
+    try:
+        profiler.stop()
+    finally:
+        _profile_lock.release()
+
+# ---------- Per-request profiling ----------
+
+class RequestProfilerMiddleware:
+    """Profiles a single request when it carries X-Profile and a superadmin X-Profile-Token.
+
+    Requests without the header go straight through. The request is cancelled after
+    PROFILER_MAX_SECONDS so a slow or streaming response can't hold the profiler.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        fmt = token = None
+        for key, value in scope["headers"]:
+            if key == b"x-profile":
+                fmt = value.decode("latin-1").strip().lower()
+            elif key == b"x-profile-token":
+                token = value.decode("latin-1").strip()
+        if fmt is None:
+            return await self.app(scope, receive, send)
+        return await self._profile(fmt, token, scope, receive, send)
+
+    async def _profile(self, fmt, token, scope, receive, send):
+        try:
+            if fmt not in FORMATS:
+                raise HTTPException(status_code=400, detail=f"X-Profile must be one of: {', '.join(FORMATS)}")
+            if not token:
+                raise HTTPException(status_code=401, detail="X-Profile-Token required")
+            if decode_token(token).get("role") != RoleEnum.SUPERADMIN:
+                raise HTTPException(status_code=403, detail="Super admin only")
+            marker = object()
+            profiler = start_profile(
+                scope["app"], settings.PROFILER_REQUEST_INTERVAL_MS / 1000, (threading.get_ident(), marker)
+            )
+        except HTTPException as he:
+            return await _send_json(send, he.status_code, {"detail": he.detail})
+        except ProfilerBusy:
+            return await _send_json(send, 409, {"detail": "A profile is already running"})
+
+        status = {"code": 500, "streaming": False}
+        cap = anyio.CancelScope(deadline=anyio.current_time() + settings.PROFILER_MAX_SECONDS)
+
+        async def capture(message):
+            # The profile replaces the response; only the original status is kept
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                for key, value in message.get("headers", []):
+                    if key.lower() == b"content-type" and value.startswith(b"text/event-stream"):
+                        # Would never end: stop right away
+                        status["streaming"] = True
+                        cap.cancel()
+
+        token = _profiled_request.set(marker)
+        try:
+            with cap:
+                await self.app(scope, receive, capture)
+        finally:
+            _profiled_request.reset(token)
+            stop_profile(profiler)
+        if status["streaming"]:
+            return await _send_json(send, 400, {"detail": "Streaming responses can't be profiled"})
+        name = f"{scope['method']} {scope['path']}"
+        body, media_type = profiler.render(fmt, name)
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", media_type.encode()),
+                (b"content-length", str(len(body)).encode()),
+                (b"x-profile-original-status", str(status["code"]).encode()),
+                (b"x-profile-samples", str(profiler.samples).encode()),
+                # The request was cancelled at PROFILER_MAX_SECONDS
+                (b"x-profile-truncated", b"1" if cap.cancelled_caught else b"0"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+async def _send_json(send, status_code: int, payload: dict):
+    body = json.dumps(payload).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
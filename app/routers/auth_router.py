@@ -8,7 +8,7 @@ from ..dependencies import get_db_for_tenant, TENANT_HEADER
 from ..models import User, RoleEnum
 from sqlalchemy import select
 from fastapi.security import OAuth2PasswordRequestForm
-from ..database import db_session, set_search_path
+from ..sharding import tenant_session
 import logging
 router = APIRouter(prefix="/auth", tags=["auth"]) 
 TENANT_HEADER = "X-Tenant-ID"
@@ -47,12 +47,7 @@ def login(form_data: OAuth2PasswordRequestForm = Depends()):
         raise HTTPException(status_code=401, detail="Invalid superadmin credentials")
 
     # Tenant user flow
-    with db_session() as s:  # directly open session
-        # validate schema name quickly
-        if not tenant_id or not tenant_id.replace("_", "").isalnum():
-            raise HTTPException(status_code=400, detail="Invalid tenant id")
-        set_search_path(s, tenant_id)
-
+    with tenant_session(tenant_id) as s:  # validates schema name, routes to the tenant's shard
         user = s.scalar(select(User).where(User.username == username, User.is_deleted == False))
         if not user or not verify_password(password, user.password_hash):
             raise HTTPException(status_code=401, detail="Invalid credentials")
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, HTTPException, Header, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from ..models import RoleEnum
+from ..auth import require_tenant_role
+from ..dependencies import TENANT_HEADER
+from ..sharding import resolve_tenant_shard, validate_tenant_id
+from ..change_feed import hub, event_stream
+
+router = APIRouter(prefix="/changes", tags=["changes"])
+
+# Employee (and Admin/Manager): stream create/update/delete events of resources and users (SSE)
+@router.get("/")
+async def stream_changes(
+    request: Request,
+    tenant_id: str = Header(..., alias=TENANT_HEADER),
+    last_event_id: str | None = Header(None, alias="Last-Event-ID"),
+    claims=Depends(require_tenant_role((RoleEnum.ADMIN, RoleEnum.MANAGER, RoleEnum.EMPLOYEE))),
+):
+    validate_tenant_id(tenant_id)
+    # A long-lived stream must only ever carry the token's own tenant
+    if claims.get("tenant_id") != tenant_id:
+        raise HTTPException(status_code=403, detail="Token does not belong to this tenant")
+    shard = await run_in_threadpool(resolve_tenant_shard, tenant_id)
+    sub = hub.subscribe(tenant_id, shard, last_event_id)
+    return StreamingResponse(
+        event_stream(sub, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,30 @@
+import asyncio
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from ..auth import require_superadmin
+from ..config import settings
+from ..profiler import ProfilerBusy, start_profile, stop_profile
+
+router = APIRouter(prefix="/debug", tags=["debug"])
+
+# Super admin: sample the whole worker process for N seconds
+@router.post("/profile")
+async def profile_process(
+    request: Request,
+    seconds: float = Query(10, gt=0),
+    format: Literal["collapsed", "speedscope"] = "collapsed",
+    claims=Depends(require_superadmin),
+):
+    if seconds > settings.PROFILER_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be <= {settings.PROFILER_MAX_SECONDS}")
+    try:
+        profiler = start_profile(request.app)
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        # Stopping joins the sampler thread (at most one sampling interval)
+        stop_profile(profiler)
+    body, media_type = profiler.render(format, f"process {seconds}s")
+    return Response(content=body, media_type=media_type, headers={"X-Profile-Samples": str(profiler.samples)})
@@ -1,24 +1,97 @@
-from fastapi import APIRouter, Depends, HTTPException
+import os
+import shutil
+import tempfile
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
-from ..schemas import TenantCreate, TenantOut
+from ..schemas import TenantCreate, TenantOut, TenantImportOut, TenantUsageOut
 from ..auth import require_superadmin
-from ..dependencies import get_db_for_public, get_db_for_tenant
+from ..dependencies import get_db_for_public
+from ..models import Tenant
 from ..tenant_service import create_tenant, drop_tenant
+from ..tenant_transfer import export_tenant, import_tenant
+from ..usage import list_usage, start_background_refresh
 
 router = APIRouter(prefix="/tenants", tags=["tenants"]) 
 
 @router.post("/", response_model=TenantOut)
-def add_tenant(payload: TenantCreate, db: Session = Depends(get_db_for_tenant), claims=Depends(require_superadmin)):
+def add_tenant(payload: TenantCreate, db: Session = Depends(get_db_for_public), claims=Depends(require_superadmin)):
     try:
-        t = create_tenant(db, payload.name, payload.schema_name)
+        t = create_tenant(db, payload.name, payload.schema_name, shard=payload.shard)
         return t
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+# Fleet view: usage per tenant, e.g. GET /tenants/usage?sort_by=resources&order=desc to find quota-heavy tenants
+@router.get("/usage", response_model=list[TenantUsageOut])
+def tenant_usage(
+    sort_by: Literal["users", "resources", "audit", "updated"] = "resources",
+    order: Literal["asc", "desc"] = "desc",
+    page: int = Query(1, ge=1),
+    size: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db_for_public),
+    claims=Depends(require_superadmin),
+):
+    return list_usage(db, sort_by, descending=order == "desc", limit=size, offset=(page - 1) * size)
+
+# Recount every tenant (bounded worker pool); needed once for tenants created before the summary existed.
+# Runs in the background of this worker: the counts update as it goes.
+@router.post("/usage/refresh", status_code=202)
+def refresh_usage(claims=Depends(require_superadmin)):
+    if not start_background_refresh():
+        raise HTTPException(status_code=409, detail="A usage refresh is already running")
+    return {"status": "started"}
+
 @router.delete("/delete_tenant")
-def remove_tenant(tenant_id: int, db: Session = Depends(get_db_for_tenant), claims=Depends(require_superadmin)):
+def remove_tenant(tenant_id: int, db: Session = Depends(get_db_for_public), claims=Depends(require_superadmin)):
     try:
         drop_tenant(db, tenant_id)
         return {"status": "deleted"}
     except ValueError as ve:
         raise HTTPException(status_code=404, detail=str(ve))
+
+
+@router.get("/{tenant_id}/export")
+def export_tenant_archive(tenant_id: int, db: Session = Depends(get_db_for_public), claims=Depends(require_superadmin)):
+    t = db.get(Tenant, tenant_id)
+    if not t:
+        raise HTTPException(status_code=404, detail="Tenant not found")
+    fd, path = tempfile.mkstemp(prefix=f"{t.schema_name}_", suffix=".tar")
+    os.close(fd)
+    try:
+        export_tenant(t.schema_name, t.shard, path)
+    except Exception:
+        os.remove(path)
+        raise
+    # The archive is streamed from disk and removed once sent
+    return FileResponse(
+        path,
+        media_type="application/x-tar",
+        filename=f"{t.schema_name}.tar",
+        background=BackgroundTask(os.remove, path),
+    )
+
+@router.post("/import", response_model=TenantImportOut)
+def import_tenant_archive(
+    archive: UploadFile = File(...),
+    name: str = Form(..., min_length=3, max_length=100),
+    schema_name: str = Form(..., min_length=3, max_length=100),
+    shard: str | None = Form(None),
+    db: Session = Depends(get_db_for_public),
+    claims=Depends(require_superadmin),
+):
+    # Spool the upload to a real file: table workers each open the archive on their own
+    with tempfile.NamedTemporaryFile(suffix=".tar", delete=False) as tmp:
+        shutil.copyfileobj(archive.file, tmp)
+    try:
+        t, manifest = import_tenant(db, tmp.name, name, schema_name, shard=shard)
+        return {
+            "tenant": t,
+            "tables": {e["table"]: e["rows"] for e in manifest["tables"]},
+        }
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    finally:
+        os.remove(tmp.name)
@@ -16,15 +16,33 @@ class LoginRequest(BaseModel):
 class TenantCreate(BaseModel):
     name: constr(min_length=3, max_length=100)
     schema_name: constr(min_length=3, max_length=100)
+    # Optional explicit shard; otherwise the placement policy chooses one
+    shard: Optional[constr(min_length=1, max_length=50)] = None
 
 class TenantOut(BaseModel):
     id: int
     name: str
     schema_name: str
+    shard: str
 
     class Config:
         from_attributes = True
 
+class TenantImportOut(BaseModel):
+    tenant: TenantOut
+    # Rows loaded per table (verified against the archive checksums)
+    tables: dict[str, int]
+
+class TenantUsageOut(BaseModel):
+    tenant_id: Optional[int]
+    name: Optional[str]
+    schema_name: str
+    shard: str
+    user_count: int
+    resource_count: int
+    audit_count: int
+    updated_at: datetime
+
 # --------- Users (tenant) ---------
 class UserCreate(BaseModel):
     username: constr(min_length=3, max_length=100)
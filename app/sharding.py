@@ -0,0 +1,194 @@
+"""
+Horizontal sharding of tenant schemas across several PostgreSQL databases.
+
+The tenants registry (public.tenants) always lives in the main database (settings.DATABASE_URL).
+Each Tenant row records the shard holding its schema; shard names map to database URLs through
+settings.SHARD_DATABASE_URLS, and the "default" shard is the main database itself.
+"""
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .database import engine, create_db_engine, db_session, set_search_path
+from .invalidation import FLUSH, bus as invalidation_bus
+from .models import Tenant
+
+# ---------- Shard engines ----------
+
+_engines: "OrderedDict[str, object]" = OrderedDict()
+_engines_lock = threading.Lock()
+
+
+def shard_names() -> list[str]:
+    """All configured shards, default shard first."""
+    return [settings.DEFAULT_SHARD] + [n for n in settings.SHARD_DATABASE_URLS if n != settings.DEFAULT_SHARD]
+
+
+def get_shard_engine(shard: str):
+    """Return the engine for `shard`, creating it lazily.
+
+    At most settings.SHARD_ENGINE_CACHE_SIZE non-default engines are kept; the least recently
+    used one is disposed (its pooled connections closed) when the limit is exceeded.
+    """
+    if shard == settings.DEFAULT_SHARD:
+        return engine
+    with _engines_lock:
+        eng = _engines.get(shard)
+        if eng is not None:
+            _engines.move_to_end(shard)
+            return eng
+        url = settings.SHARD_DATABASE_URLS.get(shard)
+        if not url:
+            raise ValueError(f"Unknown shard '{shard}'")
+        eng = create_db_engine(url)
+        _engines[shard] = eng
+        while len(_engines) > max(settings.SHARD_ENGINE_CACHE_SIZE, 1):
+            _, old_engine = _engines.popitem(last=False)
+            old_engine.dispose()
+        return eng
+
+
+@contextmanager
+def shard_session(shard: str):
+    """Like database.db_session(), but bound to the database of `shard`."""
+    if shard == settings.DEFAULT_SHARD:
+        with db_session() as s:
+            yield s
+        return
+    # Bound to the engine itself: it may be evicted from the cache meanwhile, checked out
+    # connections keep working after dispose()
+    session = Session(bind=get_shard_engine(shard), autoflush=False)
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def open_shard_engines() -> Dict[str, object]:
+    """Engines currently open, by shard (the default shard is always included)."""
+    with _engines_lock:
+        return {settings.DEFAULT_SHARD: engine, **_engines}
+
+
+def dispose_shard_engines():
+    """Close every lazily created shard engine (the default engine is left alone)."""
+    with _engines_lock:
+        while _engines:
+            _, eng = _engines.popitem(last=False)
+            eng.dispose()
+
+# ---------- Tenant -> shard lookup ----------
+
+_tenant_shards: Dict[str, str] = {}
+# Bumped on every invalidation so a lookup racing with one does not cache what it read before it
+_tenant_shards_generation = 0
+
+
+def validate_tenant_id(tenant_id: Optional[str]):
+    # Schema names are interpolated into SQL, so only allow alphanumerics and underscores
+    if not tenant_id or not tenant_id.replace("_", "").isalnum():
+        raise HTTPException(status_code=400, detail="Invalid tenant id")
+
+
+def resolve_tenant_shard(schema_name: str) -> str:
+    """Return the shard of the tenant owning `schema_name`.
+
+    Cached per process while the invalidation bus is fresh (tenant changes made by other workers
+    reach the cache through it).
+    """
+    use_cache = invalidation_bus.fresh()
+    if use_cache:
+        shard = _tenant_shards.get(schema_name)
+        if shard is not None:
+            return shard
+    generation = _tenant_shards_generation
+    with db_session() as s:
+        set_search_path(s, settings.PUBLIC_SCHEMA)
+        shard = s.scalar(select(Tenant.shard).where(Tenant.schema_name == schema_name))
+    if shard is None:
+        raise HTTPException(status_code=404, detail="Tenant not found")
+    if use_cache and generation == _tenant_shards_generation:
+        _tenant_shards[schema_name] = shard
+    return shard
+
+
+def invalidate_tenant_shard(schema_name: Optional[str] = None):
+    """Forget the cached shard of one tenant, or of all tenants when schema_name is None."""
+    global _tenant_shards_generation
+    _tenant_shards_generation += 1
+    if schema_name is None:
+        _tenant_shards.clear()
+    else:
+        _tenant_shards.pop(schema_name, None)
+
+
+def _on_invalidation(event: dict):
+    if event["scope"] == FLUSH:
+        invalidate_tenant_shard()
+    else:
+        invalidate_tenant_shard(event["tenant"])
+
+
+invalidation_bus.register(_on_invalidation, scopes=("tenant",))
+
+
+@contextmanager
+def tenant_session(tenant_id: str):
+    """Session on the tenant's shard with search_path set to the tenant schema."""
+    validate_tenant_id(tenant_id)
+    with shard_session(resolve_tenant_shard(tenant_id)) as s:
+        set_search_path(s, tenant_id)
+        # Lets the sampling profiler attribute stacks to the tenant
+        s.info["tenant_id"] = tenant_id
+        yield s
+
+# ---------- Placement policies ----------
+
+# A placement policy receives a public-schema session and the new tenant's schema name
+# and returns the shard name the tenant should be created on.
+PlacementPolicy = Callable[[Session, str], str]
+PLACEMENT_POLICIES: Dict[str, PlacementPolicy] = {}
+
+
+def register_placement_policy(name: str):
+    """Decorator registering a placement policy under `name` (see settings.SHARD_PLACEMENT_POLICY)."""
+    def _register(fn: PlacementPolicy) -> PlacementPolicy:
+        PLACEMENT_POLICIES[name] = fn
+        return fn
+    return _register
+
+
+@register_placement_policy("least_loaded")
+def least_loaded(session: Session, schema_name: str) -> str:
+    """Pick the shard currently holding the fewest tenants (ties go to the first configured)."""
+    counts = dict(session.execute(select(Tenant.shard, func.count()).group_by(Tenant.shard)).all())
+    return min(shard_names(), key=lambda name: counts.get(name, 0))
+
+
+@register_placement_policy("hash")
+def hash_placement(session: Session, schema_name: str) -> str:
+    """Stable placement by hashing the schema name."""
+    names = shard_names()
+    return names[zlib.crc32(schema_name.encode()) % len(names)]
+
+
+def choose_shard(session: Session, schema_name: str, policy: Optional[str] = None) -> str:
+    policy_name = policy or settings.SHARD_PLACEMENT_POLICY
+    fn = PLACEMENT_POLICIES.get(policy_name)
+    if fn is None:
+        raise ValueError(f"Unknown shard placement policy '{policy_name}'")
+    shard = fn(session, schema_name)
+    if shard not in shard_names():
+        raise ValueError(f"Placement policy '{policy_name}' returned unknown shard '{shard}'")
+    return shard
@@ -1,47 +1,37 @@
-from sqlalchemy import text
+from typing import Optional
 from sqlalchemy.orm import Session
-from .models import Base, Tenant, User, Resource, AuditLog
-from .database import set_search_path, table_exists, create_tenant_schema_tables
+from .models import Tenant
+from .database import create_tenant_schema_tables, drop_tenant_schema
+from .sharding import choose_shard, get_shard_engine
+from .invalidation import queue_invalidation
+from .usage import init_tenant_usage, delete_tenant_usage
 
 TENANT_TABLES_DDL_NOTE = """
 We rely on SQLAlchemy metadata to create tenant tables in the new schema by temporarily
-setting the session's search_path to the target schema and calling Base.metadata.create_all().
+setting the connection's search_path to the target schema and calling Base.metadata.create_all().
+Tenant schemas live on the shard picked for the tenant, the registry stays in the main database.
 """
 
-def create_tenant(session: Session, name: str, schema_name: str):
-    # 1) Create schema
-    session.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema_name}"'))
-    session.commit()
-    # 2) Check if tables already exist in this schema
-    if table_exists("users", schema_name):
-        print(f"Tenant schema '{schema_name}' tables already exist")
-    else:
-        # 3) Switch search_path for this session
-        # set_search_path(session, schema_name)
-        # # 4) Create tenant tables inside that schema
-        # create_tenant_schema_tables(schema_name)
+def create_tenant(session: Session, name: str, schema_name: str, shard: Optional[str] = None):
+    """Create the tenant schema on a shard and register it in the public tenants registry.
 
-        # session.execute(text(f"SET search_path TO {schema_name}, public"))
-        # session.commit()
-        print(f"Brfore creating tables for schema")
-        # Update each model’s schema dynamically
-        for table in [User.__table__, Resource.__table__, AuditLog.__table__]:
-            table.schema = schema_name
-        # Create tables
-        Base.metadata.create_all(
-            bind=session.get_bind(), 
-            tables=[User.__table__, Resource.__table__, AuditLog.__table__]
-        )
-        session.commit()
-        #Base.metadata.create_all(bind=session.get_bind())
-        print(f"Tenant schema '{schema_name}' tables created successfully")
-        # 5) Back to public
-        set_search_path(session, "public")
-    
-    # 6) Register tenant
-    t = Tenant(name=name, schema_name=schema_name)
+    `session` is a public-schema session on the main database. When `shard` is not given the
+    configured placement policy (settings.SHARD_PLACEMENT_POLICY) picks one.
+    """
+    if not schema_name.replace("_", "").isalnum():
+        raise ValueError("Invalid schema name")
+    # 1) Pick the shard and create the schema + tenant tables there
+    shard = shard or choose_shard(session, schema_name)
+    shard_engine = get_shard_engine(shard)
+    create_tenant_schema_tables(schema_name, bind=shard_engine)
+    init_tenant_usage(schema_name, shard)
+
+    # 2) Register tenant
+    t = Tenant(name=name, schema_name=schema_name, shard=shard)
     session.add(t)
     session.flush()
+    # Every worker forgets what it cached for this schema name once the registry row is committed
+    queue_invalidation(session, "tenant", schema_name)
     return t
 
 
@@ -49,6 +39,8 @@ def drop_tenant(session: Session, tenant_id: int):
     t = session.get(Tenant, tenant_id)
     if not t:
         raise ValueError("Tenant not found")
-    # Drop schema cascade (will remove all tenant tables & data)
-    session.execute(text(f'DROP SCHEMA IF EXISTS "{t.schema_name}" CASCADE'))
+    # Drop schema cascade on the tenant's shard (will remove all tenant tables & data)
+    drop_tenant_schema(t.schema_name, bind=get_shard_engine(t.shard))
+    delete_tenant_usage(t.schema_name, t.shard)
+    queue_invalidation(session, "tenant", t.schema_name)
     session.delete(t)
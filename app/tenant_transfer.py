@@ -0,0 +1,353 @@
+"""
+Streaming export/import of a single tenant with PostgreSQL COPY.
+
+An archive is an uncompressed tar holding:
+  - manifest.json         (format version, source schema, columns, row counts and sha256 per table)
+  - <table>.copy.gz       (gzip-compressed COPY text output of the table, ordered by id)
+
+The archive tables of the soft-delete archiver (users_archive, resources_archive) are transferred
+too; exporting creates them empty first if the archiver never ran for the tenant. Version 1
+archives (without them) can still be imported, the new tenant then starts with empty ones.
+
+Tables are copied in parallel, each on its own connection. Data always flows through fixed-size
+buffers (COPY -> gzip -> file and back), so memory stays constant whatever the tenant size.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
+
+import psycopg2
+from sqlalchemy import Column, DateTime, MetaData, Table, select, text
+from sqlalchemy.orm import Session
+
+from .archiver import ensure_archive_tables
+from .models import Tenant, User, Resource, AuditLog
+from .database import drop_tenant_schema, table_exists
+from .sharding import choose_shard, get_shard_engine, validate_tenant_id
+from .tenant_service import create_tenant
+from .usage import refresh_tenant_usage, delete_tenant_usage
+
+ARCHIVE_FORMAT_VERSION = 2
+# 1: no archive tables
+READABLE_FORMAT_VERSIONS = (1, 2)
+MANIFEST_NAME = "manifest.json"
+MANIFEST_TABLE_KEYS = ("table", "file", "columns", "rows", "sha256")
+
+
+def _archive_table(table) -> Table:
+    """Column layout of <table>_archive as created by archiver.ensure_archive_tables.
+
+    Kept out of the models' metadata so create_all never creates it.
+    """
+    columns = [Column(c.name, c.type) for c in table.columns] + [Column("archived_at", DateTime)]
+    return Table(f"{table.name}_archive", MetaData(), *columns)
+
+
+# Parents first: users must be loaded before the tables referencing them
+TRANSFER_TABLES = [
+    User.__table__,
+    Resource.__table__,
+    AuditLog.__table__,
+    _archive_table(User.__table__),
+    _archive_table(Resource.__table__),
+]
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+class _HashingWriter:
+    """File-like sink for COPY TO STDOUT that counts rows and hashes the data it passes on."""
+
+    def __init__(self, fileobj=None):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+        self.rows = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.sha256.update(data)
+        # COPY text format escapes embedded newlines, so one line == one row
+        self.rows += data.count(b"\n")
+        if self.fileobj is not None:
+            self.fileobj.write(data)
+        return len(data)
+
+
+class _HashingReader:
+    """File-like source for COPY FROM STDIN that hashes the data it reads."""
+
+    # Decompression errors; COPY reports them as a cancelled query
+    CORRUPT_DATA_ERRORS = (gzip.BadGzipFile, EOFError, zlib.error, tarfile.TarError)
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+        self.rows = 0
+        self.error: Optional[Exception] = None
+
+    def _consume(self, read, size):
+        try:
+            data = read(size)
+        except self.CORRUPT_DATA_ERRORS as e:
+            self.error = e
+            raise
+        self.sha256.update(data)
+        self.rows += data.count(b"\n")
+        return data
+
+    def read(self, size=COPY_CHUNK_SIZE):
+        return self._consume(self.fileobj.read, size)
+
+    def readline(self, size=-1):
+        return self._consume(self.fileobj.readline, size)
+
+
+def _quoted_columns(columns: list[str]) -> str:
+    return ", ".join(f'"{c}"' for c in columns)
+
+
+def _copy_out_sql(schema_name: str, table: str, columns: list[str]) -> str:
+    return f'COPY (SELECT {_quoted_columns(columns)} FROM "{schema_name}"."{table}" ORDER BY id) TO STDOUT'
+
+
+def _begin_repeatable_read(raw, snapshot_id: Optional[str] = None):
+    """Open an explicit REPEATABLE READ transaction on a raw psycopg2 connection.
+
+    psycopg2 starts transactions implicitly, which would make SET TRANSACTION SNAPSHOT fail,
+    so the connection is switched to autocommit and the transaction is managed by hand.
+    """
+    # Set on the DBAPI connection: the pool's connection proxy does not forward attribute writes
+    raw.dbapi_connection.autocommit = True
+    cur = raw.cursor()
+    cur.execute("BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY")
+    if snapshot_id:
+        cur.execute("SET TRANSACTION SNAPSHOT %s", (snapshot_id,))
+    return cur
+
+
+def _end_transaction(raw):
+    try:
+        raw.cursor().execute("ROLLBACK")
+    finally:
+        raw.dbapi_connection.autocommit = False
+
+
+def _copy_table_out(engine, snapshot_id: Optional[str], schema_name: str, table: str, columns: list[str], sink: _HashingWriter):
+    raw = engine.raw_connection()
+    try:
+        # Read the same snapshot as the other table workers so the archive is consistent
+        cur = _begin_repeatable_read(raw, snapshot_id)
+        try:
+            cur.copy_expert(_copy_out_sql(schema_name, table, columns), sink, size=COPY_CHUNK_SIZE)
+        finally:
+            _end_transaction(raw)
+    finally:
+        raw.close()
+
+
+def _export_table(engine, snapshot_id: str, schema_name: str, table, workdir: str) -> dict:
+    columns = [c.name for c in table.columns]
+    member = f"{table.name}.copy.gz"
+    with gzip.open(os.path.join(workdir, member), "wb", compresslevel=6) as gz:
+        sink = _HashingWriter(gz)
+        _copy_table_out(engine, snapshot_id, schema_name, table.name, columns, sink)
+    return {"table": table.name, "file": member, "columns": columns, "rows": sink.rows, "sha256": sink.sha256.hexdigest()}
+
+
+def export_tenant(schema_name: str, shard: str, dest_path: str) -> dict:
+    """Export the tenant schema `schema_name` living on `shard` into the tar archive `dest_path`.
+
+    Returns the manifest written into the archive.
+    """
+    validate_tenant_id(schema_name)
+    engine = get_shard_engine(shard)
+    ensure_archive_tables(schema_name, shard)
+    workdir = tempfile.mkdtemp(prefix=f"export_{schema_name}_")
+    try:
+        # Hold a snapshot open while the workers copy the tables in parallel
+        coordinator = engine.raw_connection()
+        try:
+            cur = _begin_repeatable_read(coordinator)
+            try:
+                cur.execute("SELECT pg_export_snapshot()")
+                snapshot_id = cur.fetchone()[0]
+                with ThreadPoolExecutor(max_workers=len(TRANSFER_TABLES)) as pool:
+                    tables = list(pool.map(
+                        lambda t: _export_table(engine, snapshot_id, schema_name, t, workdir), TRANSFER_TABLES
+                    ))
+            finally:
+                _end_transaction(coordinator)
+        finally:
+            coordinator.close()
+
+        manifest = {
+            "format_version": ARCHIVE_FORMAT_VERSION,
+            "source_schema": schema_name,
+            "source_shard": shard,
+            "exported_at": datetime.utcnow().isoformat(),
+            "compression": "gzip",
+            "tables": tables,
+        }
+        with open(os.path.join(workdir, MANIFEST_NAME), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        with tarfile.open(dest_path, "w") as tar:
+            tar.add(os.path.join(workdir, MANIFEST_NAME), arcname=MANIFEST_NAME)
+            for t in tables:
+                tar.add(os.path.join(workdir, t["file"]), arcname=t["file"])
+        return manifest
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def read_manifest(archive_path: str) -> dict:
+    """Read and validate the manifest of an archive; any problem with the upload raises ValueError."""
+    try:
+        with tarfile.open(archive_path, "r") as tar:
+            # Only regular files can be read back (extractfile() gives None for anything else)
+            members = {m.name for m in tar.getmembers() if m.isfile()}
+            if MANIFEST_NAME not in members:
+                raise KeyError(MANIFEST_NAME)
+            manifest = json.load(tar.extractfile(MANIFEST_NAME))
+    except tarfile.TarError as e:
+        raise ValueError("Not a tenant archive: not a readable tar file") from e
+    except KeyError:
+        raise ValueError(f"Not a tenant archive: {MANIFEST_NAME} is missing")
+    except (ValueError, UnicodeDecodeError) as e:
+        # json.JSONDecodeError is a ValueError, but give it a clearer message
+        raise ValueError(f"Invalid {MANIFEST_NAME}: {e}") from e
+    if not isinstance(manifest, dict):
+        raise ValueError(f"Invalid {MANIFEST_NAME}: expected an object")
+    if manifest.get("format_version") not in READABLE_FORMAT_VERSIONS:
+        raise ValueError(f"Unsupported archive format version: {manifest.get('format_version')}")
+    known = {t.name: {c.name for c in t.columns} for t in TRANSFER_TABLES}
+    try:
+        for t in manifest["tables"]:
+            if not isinstance(t, dict) or any(key not in t for key in MANIFEST_TABLE_KEYS):
+                raise ValueError(f"Invalid {MANIFEST_NAME}: table entries need {', '.join(MANIFEST_TABLE_KEYS)}")
+            # Table and column names end up in COPY statements, only accept the ones we know
+            if t["table"] not in known:
+                raise ValueError(f"Unexpected table in archive: {t['table']}")
+            if not t["columns"] or not all(isinstance(c, str) for c in t["columns"]):
+                raise ValueError(f"Invalid {MANIFEST_NAME}: no columns listed for '{t['table']}'")
+            unknown = set(t["columns"]) - known[t["table"]]
+            if unknown:
+                raise ValueError(f"Unexpected columns for '{t['table']}' in archive: {sorted(unknown)}")
+            if t["file"] not in members:
+                raise ValueError(f"Data file '{t['file']}' of table '{t['table']}' is missing from the archive")
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Invalid {MANIFEST_NAME}: malformed tables list ({e})") from e
+    return manifest
+
+
+def _import_table(engine, archive_path: str, schema_name: str, entry: dict) -> dict:
+    """Load one table; problems with the uploaded data raise ValueError."""
+    source = None
+    try:
+        # Each worker opens the archive itself: tarfile objects are not safe to share between threads
+        with tarfile.open(archive_path, "r") as tar:
+            with gzip.GzipFile(fileobj=tar.extractfile(entry["file"])) as gz:
+                source = _HashingReader(gz)
+                raw = engine.raw_connection()
+                try:
+                    cur = raw.cursor()
+                    cur.copy_expert(
+                        f'COPY "{schema_name}"."{entry["table"]}" ({_quoted_columns(entry["columns"])}) FROM STDIN',
+                        source, size=COPY_CHUNK_SIZE,
+                    )
+                    raw.commit()
+                finally:
+                    raw.close()
+    except _HashingReader.CORRUPT_DATA_ERRORS as e:
+        raise ValueError(f"Archive data for table '{entry['table']}' is corrupt: {e}") from e
+    except psycopg2.Error as e:
+        if source is not None and source.error is not None:
+            raise ValueError(f"Archive data for table '{entry['table']}' is corrupt: {source.error}") from e
+        if isinstance(e, (psycopg2.DataError, psycopg2.IntegrityError)):
+            # COPY rejected the rows (malformed text, wrong types, broken references)
+            raise ValueError(f"Archive data for table '{entry['table']}' could not be loaded: {e.diag.message_primary or e}") from e
+        raise
+    if source.sha256.hexdigest() != entry["sha256"] or source.rows != entry["rows"]:
+        raise ValueError(f"Archive data for table '{entry['table']}' is corrupt (checksum mismatch)")
+    return {"table": entry["table"], "rows": source.rows}
+
+
+def _reset_sequences(engine, schema_name: str):
+    """Continue the id sequences after the imported rows, archived ones included.
+
+    Archived rows can hold the highest ids (e.g. the newest resources were deleted and archived),
+    and a new row must never reuse the id of an archived one.
+    """
+    names = {t.name for t in TRANSFER_TABLES}
+    with engine.begin() as conn:
+        for table in (User.__table__, Resource.__table__, AuditLog.__table__):
+            sources = [table.name]
+            if f"{table.name}_archive" in names:
+                sources.append(f"{table.name}_archive")
+            max_id = "GREATEST(" + ", ".join(f'(SELECT MAX(id) FROM "{schema_name}"."{s}")' for s in sources) + ")"
+            conn.execute(
+                text(f"SELECT setval(pg_get_serial_sequence(:table, 'id'), COALESCE({max_id}, 1), {max_id} IS NOT NULL)"),
+                {"table": f'"{schema_name}"."{table.name}"'},
+            )
+
+
+def verify_tenant(schema_name: str, shard: str, manifest: dict):
+    """Re-read every table of the schema and compare row counts and checksums with `manifest`."""
+    engine = get_shard_engine(shard)
+
+    def _verify(entry: dict):
+        sink = _HashingWriter()
+        _copy_table_out(engine, None, schema_name, entry["table"], entry["columns"], sink)
+        if sink.rows != entry["rows"]:
+            raise ValueError(f"Row count mismatch for '{entry['table']}': expected {entry['rows']}, got {sink.rows}")
+        if sink.sha256.hexdigest() != entry["sha256"]:
+            raise ValueError(f"Checksum mismatch for '{entry['table']}'")
+
+    with ThreadPoolExecutor(max_workers=len(manifest["tables"])) as pool:
+        list(pool.map(_verify, manifest["tables"]))
+
+
+def import_tenant(session: Session, archive_path: str, name: str, schema_name: str, shard: Optional[str] = None):
+    """Provision a fresh tenant `schema_name` and load the archive into it.
+
+    `session` is a public-schema session on the main database; the tenant is registered in it
+    (and committed by the caller) only if loading and verification succeed, otherwise the new
+    schema is dropped again.
+    """
+    validate_tenant_id(schema_name)
+    manifest = read_manifest(archive_path)
+    if session.scalar(select(Tenant.id).where(Tenant.schema_name == schema_name)) is not None:
+        raise ValueError(f"Tenant schema '{schema_name}' is already registered")
+    shard = shard or choose_shard(session, schema_name)
+    # Never load into (or drop on failure) a schema that already holds tables
+    if table_exists("users", schema_name, bind=get_shard_engine(shard)):
+        raise ValueError(f"Schema '{schema_name}' already exists on shard '{shard}'")
+    t = create_tenant(session, name, schema_name, shard=shard)
+    engine = get_shard_engine(t.shard)
+    try:
+        ensure_archive_tables(schema_name, t.shard)
+        entries = {e["table"]: e for e in manifest["tables"]}
+        parents = [entries[tbl.name] for tbl in TRANSFER_TABLES[:1] if tbl.name in entries]
+        children = [entries[tbl.name] for tbl in TRANSFER_TABLES[1:] if tbl.name in entries]
+        for entry in parents:
+            _import_table(engine, archive_path, schema_name, entry)
+        if children:
+            with ThreadPoolExecutor(max_workers=len(children)) as pool:
+                list(pool.map(lambda e: _import_table(engine, archive_path, schema_name, e), children))
+        _reset_sequences(engine, schema_name)
+        verify_tenant(schema_name, t.shard, manifest)
+        # COPY bypasses crud.py, so recount the usage summary once
+        refresh_tenant_usage(schema_name, t.shard)
+    except Exception:
+        drop_tenant_schema(schema_name, bind=engine)
+        delete_tenant_usage(schema_name, t.shard)
+        raise
+    return t, manifest
@@ -0,0 +1,175 @@
+"""
+Cross-tenant usage summary (users / resources / audit volume per tenant).
+
+Counters live in public.tenant_usage on each shard and are maintained incrementally by crud.py,
+so the superadmin fleet view reads one small table per shard instead of scanning every tenant
+schema. refresh_all_usage() recomputes exact counts by fanning out over tenant schemas with a
+bounded worker pool (initial backfill, imports, or drift repair). The API runs it in a background
+thread (start_background_refresh) since it can take minutes on large fleets.
+"""
+import heapq
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .database import db_session, set_search_path
+from .models import Base, Tenant, TenantUsage
+from .sharding import get_shard_engine, shard_names, validate_tenant_id
+
+logger = logging.getLogger(__name__)
+
+USAGE_SORT_COLUMNS = {
+    "users": "user_count",
+    "resources": "resource_count",
+    "audit": "audit_count",
+    "updated": "updated_at",
+}
+
+# (entity, op) of a change event -> (users delta, resources delta)
+_USAGE_DELTAS = {
+    ("user", "created"): (1, 0),
+    ("user", "deleted"): (-1, 0),
+    ("resource", "created"): (0, 1),
+    ("resource", "deleted"): (0, -1),
+}
+
+_INSERT_EMPTY_USAGE = (
+    "INSERT INTO public.tenant_usage (schema_name, user_count, resource_count, audit_count, updated_at) "
+    "VALUES (:schema, 0, 0, 0, now() AT TIME ZONE 'utc') ON CONFLICT (schema_name) DO NOTHING"
+)
+
+# ---------- Incremental maintenance ----------
+
+def ensure_usage_table(bind):
+    Base.metadata.create_all(bind=bind, tables=[TenantUsage.__table__])
+
+
+def record_usage(db: Session, entity: str, op: str):
+    """Apply the counter changes of one audited mutation to the tenant's usage row.
+
+    Runs in the mutation's transaction. Tenants without a usage row yet are left alone until
+    a refresh creates it with exact counts.
+    """
+    users, resources = _USAGE_DELTAS.get((entity, op), (0, 0))
+    db.execute(
+        text(
+            "UPDATE public.tenant_usage SET user_count = user_count + :users, "
+            "resource_count = resource_count + :resources, audit_count = audit_count + 1, "
+            "updated_at = now() AT TIME ZONE 'utc' WHERE schema_name = current_schema()"
+        ),
+        {"users": users, "resources": resources},
+    )
+
+
+def init_tenant_usage(schema_name: str, shard: str):
+    """Create the (empty) usage row of a freshly provisioned tenant."""
+    engine = get_shard_engine(shard)
+    ensure_usage_table(engine)
+    with engine.begin() as conn:
+        conn.execute(text(_INSERT_EMPTY_USAGE), {"schema": schema_name})
+
+
+def delete_tenant_usage(schema_name: str, shard: str):
+    with get_shard_engine(shard).begin() as conn:
+        conn.execute(text("DELETE FROM public.tenant_usage WHERE schema_name = :schema"), {"schema": schema_name})
+
+# ---------- Full refresh ----------
+
+def refresh_tenant_usage(schema_name: str, shard: str):
+    """Recompute the exact counters of one tenant."""
+    validate_tenant_id(schema_name)
+    engine = get_shard_engine(shard)
+    with engine.begin() as conn:
+        conn.execute(text(_INSERT_EMPTY_USAGE), {"schema": schema_name})
+        # Lock the row before counting: mutations that already bumped it are waited for (and then
+        # counted), later ones block until this transaction commits and add their delta on top
+        conn.execute(text("SELECT 1 FROM public.tenant_usage WHERE schema_name = :schema FOR UPDATE"), {"schema": schema_name})
+        conn.execute(
+            text(
+                "UPDATE public.tenant_usage SET "
+                f'user_count = (SELECT count(*) FROM "{schema_name}".users WHERE is_deleted = false), '
+                f'resource_count = (SELECT count(*) FROM "{schema_name}".resources WHERE is_deleted = false), '
+                f'audit_count = (SELECT count(*) FROM "{schema_name}".audit_logs), '
+                "updated_at = now() AT TIME ZONE 'utc' WHERE schema_name = :schema"
+            ),
+            {"schema": schema_name},
+        )
+
+
+def refresh_all_usage(max_workers: Optional[int] = None) -> int:
+    """Recompute the counters of every tenant with a bounded pool of workers. Returns the tenant count."""
+    for shard in shard_names():
+        ensure_usage_table(get_shard_engine(shard))
+    with db_session() as s:
+        set_search_path(s, settings.PUBLIC_SCHEMA)
+        tenants = s.execute(select(Tenant.schema_name, Tenant.shard).order_by(Tenant.id)).all()
+    with ThreadPoolExecutor(max_workers=max_workers or settings.USAGE_REFRESH_WORKERS) as pool:
+        list(pool.map(lambda t: refresh_tenant_usage(*t), tenants))
+    return len(tenants)
+
+
+_refresh_thread: Optional[threading.Thread] = None
+_refresh_lock = threading.Lock()
+
+
+def _refresh_in_background():
+    try:
+        count = refresh_all_usage()
+        print(f"Usage summary refreshed for {count} tenants")
+    except Exception:
+        logger.exception("Usage refresh failed")
+
+
+def start_background_refresh() -> bool:
+    """Start refresh_all_usage() in a background thread; False if one is already running."""
+    global _refresh_thread
+    with _refresh_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return False
+        _refresh_thread = threading.Thread(target=_refresh_in_background, name="usage-refresh", daemon=True)
+        _refresh_thread.start()
+        return True
+
+# ---------- Fleet view ----------
+
+def list_usage(session: Session, sort_by: str = "resources", descending: bool = True, limit: int = 50, offset: int = 0) -> list[dict]:
+    """Page of tenant usage rows across all shards, sorted by `sort_by`.
+
+    `session` is a public-schema session on the main database (used for tenant names).
+    """
+    column = USAGE_SORT_COLUMNS[sort_by]
+    direction = "DESC" if descending else "ASC"
+    per_shard = []
+    for shard in shard_names():
+        with get_shard_engine(shard).connect() as conn:
+            rows = conn.execute(
+                text(
+                    "SELECT schema_name, user_count, resource_count, audit_count, updated_at FROM public.tenant_usage "
+                    f"ORDER BY {column} {direction}, schema_name LIMIT :n"
+                ),
+                {"n": offset + limit},
+            ).mappings().all()
+        per_shard.append([dict(r, shard=shard) for r in rows])
+
+    # Each shard's rows are already sorted: merge them and cut the requested page
+    merged = heapq.merge(*per_shard, key=lambda r: r[column], reverse=descending)
+    page = [r for i, r in zip(range(offset + limit), merged) if i >= offset]
+
+    tenants = {}
+    if page:
+        tenants = {
+            row.schema_name: row
+            for row in session.execute(
+                select(Tenant.schema_name, Tenant.id, Tenant.name).where(Tenant.schema_name.in_([r["schema_name"] for r in page]))
+            )
+        }
+    for r in page:
+        t = tenants.get(r["schema_name"])
+        r["tenant_id"] = t.id if t else None
+        r["name"] = t.name if t else None
+    return page
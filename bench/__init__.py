@@ -0,0 +1,9 @@
+"""
+Load-test and benchmark suite.
+
+    python -m bench --tenants 3 --concurrency 32 --duration 30 --serve --output bench.json
+
+Provisions synthetic tenants (bench.fixtures), drives a weighted mix of API calls with an asyncio
+HTTP client (bench.load) and writes throughput and p50/p95/p99 latency per endpoint as JSON
+(bench.report), so runs can be compared across commits with `python -m bench.report old.json new.json`.
+"""
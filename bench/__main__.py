@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+import json
+
+from .fixtures import load_existing, provision, teardown
+from .load import DEFAULT_MIX, parse_mix, run_load
+from .report import build_report
+from .server import start_server
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Multi-tenant load test")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="Running app to test (ignored with --serve)")
+    parser.add_argument("--serve", action="store_true", help="Start the app with serve.py for the run")
+    parser.add_argument("--server-workers", type=int, default=1)
+    parser.add_argument("--tenants", type=int, default=3)
+    parser.add_argument("--users", type=int, default=50, help="Users per tenant (max 50)")
+    parser.add_argument("--resources", type=int, default=450, help="Seeded resources per tenant (max 490, creates need headroom)")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Unmeasured seconds before the run")
+    parser.add_argument("--mix", default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--prefix", default="bench", help="Schema prefix of the benchmark tenants")
+    parser.add_argument("--skip-provision", action="store_true", help="Reuse tenants from a previous run")
+    parser.add_argument("--teardown", action="store_true", help="Drop the benchmark tenants afterwards")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    if args.skip_provision:
+        tenants = load_existing(args.prefix)
+        if not tenants:
+            parser.error(f"No tenants with prefix '{args.prefix}' to reuse")
+    else:
+        tenants = provision(args.tenants, args.prefix, args.users, min(args.resources, 490))
+    proc = None
+    try:
+        base_url = args.base_url
+        if args.serve:
+            proc, base_url = start_server(args.server_workers)
+        samples, elapsed = asyncio.run(
+            run_load(base_url, tenants, args.concurrency, args.duration, mix, args.warmup, args.seed)
+        )
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        if args.teardown:
+            teardown(args.prefix)
+
+    report = build_report(samples, elapsed, {
+        "tenants": len(tenants),
+        "users_per_tenant": args.users,
+        "resources_per_tenant": args.resources,
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "mix": mix,
+        "seed": args.seed,
+    })
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+        print(f"Report written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
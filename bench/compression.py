@@ -0,0 +1,143 @@
+"""
+Bytes and latency saved by response compression on typical tenant pages.
+
+    python -m bench.compression --serve --requests 50 --bandwidth-mbit 10 --bandwidth-mbit 100
+
+Every page is fetched `--requests` times per Accept-Encoding (identity, gzip, br, zstd).
+The benchmark records the bytes on the wire and the request latency over loopback. Loopback
+includes the server's compression time but hardly any transfer time, so the report also
+estimates the response time on slower links: p50 latency + wire bytes / bandwidth. The
+"served" column shows what the server actually sent. Responses below COMPRESSION_MIN_SIZE, and
+encodings whose optional package is not installed, come back as identity.
+"""
+import argparse
+import json
+import time
+
+import httpx
+
+from .fixtures import BENCH_PASSWORD, load_existing, provision, teardown
+from .report import git_commit, percentile
+from .server import start_server
+
+ENCODINGS = ("identity", "gzip", "br", "zstd")
+
+
+def _pages(tenant) -> dict[str, tuple[str, dict]]:
+    """Label -> (path, query params) of the pages measured."""
+    return {
+        "GET /resources/?size=100": ("/resources/", {"size": 100}),
+        "GET /resources/?size=20": ("/resources/", {"size": 20}),
+        "GET /resources/{id}": (f"/resources/{tenant.resource_ids[0]}", {}),
+        "GET /audit-logs/": ("/audit-logs/", {}),
+    }
+
+
+def _seed_audit(client: httpx.Client, headers: dict, admin_id: int, entries: int):
+    """Create and delete resources through the API so the audit log has `entries` rows to page."""
+    for i in range(entries // 2):
+        r = client.post("/resources/", json={"name": f"audit-{i:04d}", "description": "compression benchmark", "owner_id": admin_id}, headers=headers)
+        r.raise_for_status()
+        client.delete(f"/resources/{r.json()['id']}", headers=headers).raise_for_status()
+
+
+def _measure(client: httpx.Client, path: str, params: dict, headers: dict, encoding: str, requests: int) -> dict:
+    latencies, sizes, served = [], [], None
+    for _ in range(requests):
+        start = time.perf_counter()
+        with client.stream("GET", path, params=params, headers={**headers, "Accept-Encoding": encoding}) as r:
+            r.raise_for_status()
+            # Raw bytes: what went over the wire, before httpx decodes anything
+            size = sum(len(chunk) for chunk in r.iter_raw())
+            served = r.headers.get("content-encoding", "identity")
+        latencies.append(time.perf_counter() - start)
+        sizes.append(size)
+    latencies.sort()
+    return {
+        "served_encoding": served,
+        "bytes": round(sum(sizes) / len(sizes)),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+    }
+
+
+def run(base_url: str, tenant, requests: int, bandwidths: list[float], audit_entries: int) -> dict:
+    # Fresh connection per request would measure TCP setup, keep-alive measures the response
+    with httpx.Client(base_url=base_url, timeout=30.0) as client:
+        login = client.post("/auth/login", data={"username": tenant.admin, "password": BENCH_PASSWORD, "client_id": tenant.schema_name})
+        login.raise_for_status()
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}", "X-Tenant-ID": tenant.schema_name}
+        if audit_entries:
+            _seed_audit(client, headers, tenant.admin_id, audit_entries)
+
+        pages = {}
+        for label, (path, params) in _pages(tenant).items():
+            results = {encoding: _measure(client, path, params, headers, encoding, requests) for encoding in ENCODINGS}
+            base = results["identity"]
+            for m in results.values():
+                m["ratio"] = round(m["bytes"] / base["bytes"], 3) if base["bytes"] else 1.0
+                m["bytes_saved"] = base["bytes"] - m["bytes"]
+                # Estimated response time on a link of the given bandwidth
+                for mbit in bandwidths:
+                    m[f"est_ms_at_{mbit:g}mbit"] = round(m["p50_ms"] + m["bytes"] * 8 / (mbit * 1e6) * 1000, 3)
+            pages[label] = results
+    return pages
+
+
+def _print_table(pages: dict, bandwidths: list[float]):
+    est_cols = [f"est_ms_at_{mbit:g}mbit" for mbit in bandwidths]
+    header = f"{'page':<26} {'accept':<9} {'served':<9} {'bytes':>8} {'ratio':>6} {'p50 ms':>8} " + " ".join(f"{c[7:]:>16}" for c in est_cols)
+    print(header)
+    for label, results in pages.items():
+        for encoding, m in results.items():
+            ests = " ".join(f"{m[c]:>16.3f}" for c in est_cols)
+            print(f"{label:<26} {encoding:<9} {m['served_encoding']:<9} {m['bytes']:>8} {m['ratio']:>6.3f} {m['p50_ms']:>8.3f} {ests}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench.compression", description="Response compression benchmark")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="Running app to test (ignored with --serve)")
+    parser.add_argument("--serve", action="store_true", help="Start the app with serve.py for the run")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per page and encoding")
+    parser.add_argument("--bandwidth-mbit", type=float, action="append", help="Link bandwidths for the estimates (repeatable, default 10 and 100)")
+    parser.add_argument("--audit-entries", type=int, default=200, help="Audit rows to generate before measuring")
+    parser.add_argument("--prefix", default="bench", help="Schema prefix of the benchmark tenants")
+    parser.add_argument("--skip-provision", action="store_true", help="Reuse a tenant from a previous run")
+    parser.add_argument("--teardown", action="store_true", help="Drop the benchmark tenants afterwards")
+    parser.add_argument("--output", help="Also write the JSON report here")
+    args = parser.parse_args()
+    bandwidths = args.bandwidth_mbit or [10.0, 100.0]
+
+    if args.skip_provision:
+        tenants = load_existing(args.prefix)
+        if not tenants:
+            parser.error(f"No tenants with prefix '{args.prefix}' to reuse")
+    else:
+        tenants = provision(1, args.prefix)
+    proc = None
+    try:
+        base_url = args.base_url
+        if args.serve:
+            proc, base_url = start_server(1)
+        pages = run(base_url, tenants[0], args.requests, bandwidths, args.audit_entries)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        if args.teardown:
+            teardown(args.prefix)
+
+    _print_table(pages, bandwidths)
+    if args.output:
+        report = {
+            "commit": git_commit(),
+            "config": {"requests": args.requests, "bandwidths_mbit": bandwidths, "audit_entries": args.audit_entries},
+            "pages": pages,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Synthetic multi-tenant fixtures for the benchmark.
+
+Tenants are provisioned with tenant_service.create_tenant (so they land on shards like real ones)
+and seeded close to the business limits: 50 users and 450 of the 500 resources per tenant by
+default. The admin owns no seeded resources and the last users are left empty, so the
+resources created during a run (create_owner_ids) have room both per owner and tenant-wide.
+Seeding bulk-inserts rows with one precomputed password hash instead of going through crud.py, which
+would hash every password and audit every row.
+"""
+from dataclasses import dataclass, field
+
+from sqlalchemy import func, select, insert
+
+from app.auth import hash_password
+from app.config import settings
+from app.database import db_session, set_search_path, create_all_tables
+from app.models import Tenant, User, Resource, RoleEnum
+from app.sharding import tenant_session
+from app.tenant_service import create_tenant, drop_tenant
+from app.usage import refresh_tenant_usage
+
+BENCH_PASSWORD = "bench-password"
+MAX_USERS = 50
+MAX_RESOURCES = 500
+MAX_RESOURCES_PER_OWNER = 10
+
+
+@dataclass
+class BenchTenant:
+    schema_name: str
+    shard: str
+    admin: str
+    employees: list[str] = field(default_factory=list)
+    admin_id: int = 0
+    resource_ids: list[int] = field(default_factory=list)
+    # Owners for the resources created during a run, admin first: one entry per resource an
+    # owner can still take, capped by the tenant-wide limit
+    create_owner_ids: list[int] = field(default_factory=list)
+
+
+def _create_owner_ids(owners: list[int], counts: dict) -> list[int]:
+    slots = []
+    for owner_id in owners:
+        slots.extend([owner_id] * max(MAX_RESOURCES_PER_OWNER - counts.get(owner_id, 0), 0))
+    return slots[:max(MAX_RESOURCES - sum(counts.values()), 0)]
+
+
+def tenant_schema(prefix: str, i: int) -> str:
+    return f"{prefix}_{i:04d}"
+
+
+def _seed_tenant(schema_name: str, shard: str, users: int, resources: int, password_hash: str) -> BenchTenant:
+    users = min(users, MAX_USERS)
+    with tenant_session(schema_name) as s:
+        admin = f"{schema_name}_admin"
+        rows = [{"username": admin, "password_hash": password_hash, "role": RoleEnum.ADMIN.value, "is_deleted": False}]
+        for u in range(1, users):
+            role = RoleEnum.MANAGER if u % 10 == 0 else RoleEnum.EMPLOYEE
+            rows.append({"username": f"{schema_name}_user{u:02d}", "password_hash": password_hash, "role": role.value, "is_deleted": False})
+        s.execute(insert(User), rows)
+        owners = s.execute(select(User.id, User.username).order_by(User.id)).all()
+        admin_id = owners[0].id
+
+        # Resources go to the non-admin users (at most 10 each) so the admin keeps capacity for
+        # the resources created during the run
+        resource_rows = []
+        for owner_id, _ in owners[1:]:
+            for _ in range(MAX_RESOURCES_PER_OWNER):
+                if len(resource_rows) >= resources:
+                    break
+                n = len(resource_rows)
+                resource_rows.append({
+                    "name": f"resource-{n:04d}",
+                    "description": f"Synthetic benchmark resource {n} of {schema_name}",
+                    "owner_id": owner_id,
+                    "is_deleted": False,
+                })
+        if resource_rows:
+            s.execute(insert(Resource), resource_rows)
+        resource_ids = list(s.scalars(select(Resource.id).order_by(Resource.id)).all())
+        counts = {}
+        for row in resource_rows:
+            counts[row["owner_id"]] = counts.get(row["owner_id"], 0) + 1
+    refresh_tenant_usage(schema_name, shard)
+    return BenchTenant(
+        schema_name=schema_name,
+        shard=shard,
+        admin=admin,
+        employees=[name for _, name in owners[1:]],
+        admin_id=admin_id,
+        resource_ids=resource_ids,
+        create_owner_ids=_create_owner_ids([owner_id for owner_id, _ in owners], counts),
+    )
+
+
+def provision(n_tenants: int, prefix: str = "bench", users: int = MAX_USERS, resources: int = 450) -> list[BenchTenant]:
+    """Create (or recreate) `n_tenants` seeded benchmark tenants."""
+    create_all_tables()
+    teardown(prefix)
+    password_hash = hash_password(BENCH_PASSWORD)
+    tenants = []
+    for i in range(n_tenants):
+        schema_name = tenant_schema(prefix, i)
+        with db_session() as s:
+            set_search_path(s, settings.PUBLIC_SCHEMA)
+            t = create_tenant(s, f"Benchmark {schema_name}", schema_name)
+            shard = t.shard
+        tenants.append(_seed_tenant(schema_name, shard, users, resources, password_hash))
+        print(f"Provisioned {schema_name} on shard '{shard}' ({len(tenants[-1].resource_ids)} resources)")
+    return tenants
+
+
+def load_existing(prefix: str = "bench") -> list[BenchTenant]:
+    """Describe tenants seeded by an earlier provision() run, without reseeding them."""
+    with db_session() as s:
+        set_search_path(s, settings.PUBLIC_SCHEMA)
+        rows = s.execute(
+            select(Tenant.schema_name, Tenant.shard).where(Tenant.schema_name.like(f"{prefix}\\_%")).order_by(Tenant.schema_name)
+        ).all()
+    tenants = []
+    for schema_name, shard in rows:
+        with tenant_session(schema_name) as s:
+            users = s.execute(select(User.id, User.username).where(User.is_deleted == False).order_by(User.id)).all()
+            resource_ids = list(s.scalars(select(Resource.id).where(Resource.is_deleted == False).order_by(Resource.id)).all())
+            counts = dict(s.execute(
+                select(Resource.owner_id, func.count()).where(Resource.is_deleted == False).group_by(Resource.owner_id)
+            ).all())
+        tenants.append(BenchTenant(
+            schema_name=schema_name,
+            shard=shard,
+            admin=users[0].username,
+            employees=[u.username for u in users[1:]],
+            admin_id=users[0].id,
+            resource_ids=resource_ids,
+            create_owner_ids=_create_owner_ids([u.id for u in users], counts),
+        ))
+    return tenants
+
+
+def teardown(prefix: str = "bench"):
+    """Drop every tenant created by provision() with this prefix."""
+    with db_session() as s:
+        set_search_path(s, settings.PUBLIC_SCHEMA)
+        ids = s.scalars(select(Tenant.id).where(Tenant.schema_name.like(f"{prefix}\\_%"))).all()
+        for tenant_id in ids:
+            drop_tenant(s, tenant_id)
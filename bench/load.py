@@ -0,0 +1,141 @@
+"""
+Asyncio load generator: `concurrency` workers pick operations from a weighted mix and record the
+latency of every request under its endpoint label (e.g. "GET /resources/{id}").
+"""
+import asyncio
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import httpx
+
+from .fixtures import BenchTenant, BENCH_PASSWORD
+
+DEFAULT_MIX = {"login": 1, "list": 10, "get": 10, "create": 2, "audit": 1}
+
+
+def parse_mix(spec: str) -> dict[str, int]:
+    """Parse "login=1,list=10,..." into an operation -> weight mapping."""
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown operation '{name}' (expected one of {', '.join(DEFAULT_MIX)})")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+@dataclass
+class Samples:
+    latencies: dict = field(default_factory=lambda: defaultdict(list))
+    errors: dict = field(default_factory=lambda: defaultdict(int))
+
+    def record(self, label: str, seconds: float, ok: bool):
+        self.latencies[label].append(seconds)
+        if not ok:
+            self.errors[label] += 1
+
+
+class _Session:
+    """Per-tenant auth headers shared by all workers."""
+
+    def __init__(self, tenant: BenchTenant, admin_token: str, employee_token: str):
+        self.tenant = tenant
+        self.admin = {"Authorization": f"Bearer {admin_token}", "X-Tenant-ID": tenant.schema_name}
+        self.employee = {"Authorization": f"Bearer {employee_token}", "X-Tenant-ID": tenant.schema_name}
+
+
+async def _login(client: httpx.AsyncClient, schema_name: str, username: str) -> httpx.Response:
+    return await client.post(
+        "/auth/login",
+        data={"username": username, "password": BENCH_PASSWORD, "client_id": schema_name},
+    )
+
+
+async def _timed(samples: Samples, label: str, request) -> httpx.Response | None:
+    start = time.perf_counter()
+    try:
+        response = await request
+    except httpx.HTTPError:
+        samples.record(label, time.perf_counter() - start, False)
+        return None
+    samples.record(label, time.perf_counter() - start, response.status_code < 400)
+    return response
+
+
+async def _run_op(op: str, client: httpx.AsyncClient, sess: _Session, samples: Samples, rng: random.Random, slot: int):
+    t = sess.tenant
+    if op == "login":
+        await _timed(samples, "POST /auth/login", _login(client, t.schema_name, rng.choice(t.employees)))
+    elif op == "list":
+        params = {"page": rng.randint(1, 5), "size": rng.choice((10, 20, 50, 100))}
+        await _timed(samples, "GET /resources/", client.get("/resources/", params=params, headers=sess.employee))
+    elif op == "get":
+        rid = rng.choice(t.resource_ids)
+        await _timed(samples, "GET /resources/{id}", client.get(f"/resources/{rid}", headers=sess.employee))
+    elif op == "create":
+        # Create + delete keeps the tenant below its resource limits for the whole run. Each worker
+        # has a slot of its own (it never has two created resources alive), so concurrent workers
+        # don't pile onto one owner's 10-resource limit
+        owner_id = t.create_owner_ids[slot % len(t.create_owner_ids)]
+        body = {"name": f"bench-{rng.getrandbits(32):08x}", "description": "created during benchmark", "owner_id": owner_id}
+        response = await _timed(samples, "POST /resources/", client.post("/resources/", json=body, headers=sess.admin))
+        if response is not None and response.status_code == 200:
+            rid = response.json()["id"]
+            await _timed(samples, "DELETE /resources/{id}", client.delete(f"/resources/{rid}", headers=sess.admin))
+    elif op == "audit":
+        await _timed(samples, "GET /audit-logs/", client.get("/audit-logs/", headers=sess.admin))
+
+
+async def _worker(deadline: float, client, sessions, ops, weights, samples: Samples, seed: int, slot: int):
+    rng = random.Random(seed)
+    while time.perf_counter() < deadline:
+        op = rng.choices(ops, weights)[0]
+        await _run_op(op, client, rng.choice(sessions), samples, rng, slot)
+
+
+async def run_load(
+    base_url: str,
+    tenants: list[BenchTenant],
+    concurrency: int,
+    duration: float,
+    mix: dict[str, int],
+    warmup: float = 0.0,
+    seed: int = 0,
+) -> tuple[Samples, float]:
+    """Drive the mix against `base_url`. Returns the samples and the measured wall time."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+        sessions = []
+        for t in tenants:
+            admin, employee = await asyncio.gather(
+                _login(client, t.schema_name, t.admin), _login(client, t.schema_name, t.employees[0])
+            )
+            admin.raise_for_status()
+            employee.raise_for_status()
+            sessions.append(_Session(t, admin.json()["access_token"], employee.json()["access_token"]))
+
+        ops = list(mix)
+        weights = [mix[o] for o in ops]
+        if "create" in mix:
+            for t in tenants:
+                if not t.create_owner_ids:
+                    raise ValueError(f"No owner of {t.schema_name} has room for the 'create' operation")
+                if concurrency > len(t.create_owner_ids):
+                    print(f"Warning: {t.schema_name} has room for {len(t.create_owner_ids)} concurrent creates, "
+                          f"'create' may hit resource limits with {concurrency} workers")
+        if warmup > 0:
+            deadline = time.perf_counter() + warmup
+            await asyncio.gather(*(
+                _worker(deadline, client, sessions, ops, weights, Samples(), seed + i, i) for i in range(concurrency)
+            ))
+
+        samples = Samples()
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*(
+            _worker(deadline, client, sessions, ops, weights, samples, seed + 1000 + i, i) for i in range(concurrency)
+        ))
+        return samples, time.perf_counter() - start
@@ -0,0 +1,79 @@
+"""
+JSON benchmark reports and comparison between two runs.
+
+    python -m bench.report baseline.json candidate.json
+"""
+import json
+import math
+import subprocess
+import sys
+from datetime import datetime
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def _stats(latencies: list[float], errors: int, elapsed: float) -> dict:
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_report(samples, elapsed: float, meta: dict) -> dict:
+    """`samples` is a bench.load.Samples."""
+    everything = [v for values in samples.latencies.values() for v in values]
+    return {
+        "meta": {"commit": git_commit(), "finished_at": datetime.utcnow().isoformat(), "elapsed_s": round(elapsed, 3), **meta},
+        "total": _stats(everything, sum(samples.errors.values()), elapsed),
+        "endpoints": {
+            label: _stats(values, samples.errors.get(label, 0), elapsed)
+            for label, values in sorted(samples.latencies.items())
+        },
+    }
+
+
+def compare(baseline: dict, candidate: dict) -> list[str]:
+    """Human-readable per-endpoint deltas (candidate vs baseline)."""
+    lines = [f"baseline {baseline['meta'].get('commit')} -> candidate {candidate['meta'].get('commit')}"]
+    rows = [("total", baseline["total"], candidate["total"])]
+    rows += [
+        (label, baseline["endpoints"][label], stats)
+        for label, stats in candidate["endpoints"].items() if label in baseline["endpoints"]
+    ]
+    for label, old, new in rows:
+        parts = []
+        for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            parts.append(f"{key} {old[key]} -> {new[key]} ({change:+.1f}%)")
+        lines.append(f"{label}: " + ", ".join(parts))
+    return lines
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python -m bench.report <baseline.json> <candidate.json>")
+        sys.exit(1)
+    with open(sys.argv[1]) as f1, open(sys.argv[2]) as f2:
+        print("\n".join(compare(json.load(f1), json.load(f2))))
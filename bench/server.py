@@ -0,0 +1,35 @@
+"""Starts the app under test on a free local port."""
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers: int) -> tuple[subprocess.Popen, str]:
+    """Run the app with serve.py on a free local port (same env, so the same DATABASE_URL)."""
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "serve.py", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            if httpx.get(base_url + "/health").status_code == 200:
+                return proc, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("Server did not become healthy")
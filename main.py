@@ -1,27 +1,73 @@
 from fastapi import FastAPI
-from app.database import engine, create_all_tables
+from fastapi.responses import JSONResponse
+from app.database import engine, create_all_tables, upgrade_tenant_schemas
 from app.models import Base, Tenant
 from app.config import settings
-from app.routers import tenant_router, auth_router, user_router, resource_router, audit_router
+from app.routers import tenant_router, auth_router, user_router, resource_router, audit_router, change_router, debug_router
+from app.profiler import RequestProfilerMiddleware
+from app.compression import CompressionMiddleware
+from app.change_feed import hub as change_hub
+from app.sharding import get_shard_engine, shard_names
+from app.archiver import start_background_archiver, stop_background_archiver
+from app.usage import ensure_usage_table
+from app.pool import warm_all_pools, start_pool_validator, stop_pool_validator, pool_status
+from app.invalidation import bus as invalidation_bus
 
 app = FastAPI(title="Multi-Tenant Resource Management System", version="1.0.0")
+# Per-request profiling (X-Profile header); a header check only when not used
+app.add_middleware(RequestProfilerMiddleware)
+# Added last so it wraps everything else (profiles are compressed too)
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+def init_database():
+    """Create/upgrade the public tables and tenant schemas (also run once by serve.py before forking workers)"""
+    # Create all tables in the public schema (Tenant table only) if they don't exist
+    create_all_tables()
+    # Add columns/indexes introduced since tenant schemas were created
+    for shard in shard_names():
+        upgrade_tenant_schemas(get_shard_engine(shard))
+        ensure_usage_table(get_shard_engine(shard))
 
 # Create PUBLIC schema tables (Tenants registry) on startup
 @app.on_event("startup")
 def on_startup():
     print("Starting Multi-Tenant Resource Management System...")
-    # Create all tables in the public schema (Tenant table only) if they don't exist
-    create_all_tables()
+    if not settings.SKIP_DB_INIT:
+        init_database()
+    # Keeps in-process caches in sync with writes made by other workers
+    invalidation_bus.start()
+    if settings.ARCHIVE_ENABLED:
+        start_background_archiver()
+    # Open pooled connections up front so the first requests after a deploy don't pay for connecting
+    warm_all_pools()
+    start_pool_validator()
     print("Application startup completed")
 
+@app.on_event("shutdown")
+def on_shutdown():
+    # Stop change feed listener threads (they hold dedicated LISTEN connections)
+    change_hub.stop()
+    stop_background_archiver()
+    stop_pool_validator()
+    invalidation_bus.stop()
+
 # Routers
 app.include_router(auth_router.router)
 app.include_router(tenant_router.router)
 app.include_router(user_router.router)
 app.include_router(resource_router.router)
 app.include_router(audit_router.router)
+app.include_router(change_router.router)
+app.include_router(debug_router.router)
 
 # Health
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+# Readiness: 503 until the connection pools are warm and their last validation succeeded
+@app.get("/ready")
+def ready():
+    status = pool_status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
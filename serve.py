@@ -0,0 +1,84 @@
+"""
+Multi-worker runner: python serve.py --workers 4 --port 8000
+
+Runs main:app in several uvicorn worker processes. Each worker has its own connection pools,
+so the connection budget of the deployment (settings.DB_MAX_CONNECTIONS per database, or
+--db-max-connections) is split between the workers and handed to them as DB_POOL_SIZE /
+DB_MAX_OVERFLOW environment variables. Table creation and tenant schema upgrades run once here
+before the workers start (the workers get SKIP_DB_INIT=1) instead of racing in every worker. In-process caches stay consistent
+across workers through the invalidation bus (app/invalidation.py).
+"""
+import argparse
+import os
+
+import uvicorn
+
+from app.config import settings
+
+# Connections a worker opens outside its pools on each database: the invalidation bus and the
+# change feed LISTEN connections
+RESERVED_CONNECTIONS_PER_WORKER = 2
+# Smallest pool worth running a worker for (pool size + overflow)
+MIN_POOL_CONNECTIONS_PER_WORKER = 2
+
+
+def pool_sizes(max_connections: int, workers: int) -> tuple[int, int]:
+    """(pool_size, max_overflow) per worker so that all workers stay within max_connections per database.
+
+    Half of a worker's share is kept open (and warmed at startup), the other half is overflow
+    opened only under load.
+    """
+    share = max_connections // workers - RESERVED_CONNECTIONS_PER_WORKER
+    if share < 1:
+        raise ValueError(f"{max_connections} connections are not enough for {workers} workers")
+    pool_size = max(share // 2, 1)
+    return pool_size, share - pool_size
+
+
+def default_workers(max_connections: int) -> int:
+    """One worker per CPU, but no more than the connection budget can give a useful pool."""
+    budget = max_connections // (RESERVED_CONNECTIONS_PER_WORKER + MIN_POOL_CONNECTIONS_PER_WORKER)
+    return max(min(os.cpu_count() or 1, budget), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python serve.py", description="Run the app with several worker processes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count, capped by the connection budget)")
+    parser.add_argument("--db-max-connections", type=int, default=settings.DB_MAX_CONNECTIONS,
+                        help="Connections all workers together may open per database")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    workers = args.workers or default_workers(args.db_max_connections)
+    try:
+        pool_size, max_overflow = pool_sizes(args.db_max_connections, workers)
+    except ValueError as e:
+        parser.error(str(e))
+    # Worker processes are spawned, so they read their settings from this environment
+    # (a single worker runs in this process and uses `settings` directly)
+    os.environ["DB_POOL_SIZE"] = str(pool_size)
+    os.environ["DB_MAX_OVERFLOW"] = str(max_overflow)
+    settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW = pool_size, max_overflow
+    os.environ["SKIP_DB_INIT"] = "1"
+    settings.SKIP_DB_INIT = True
+    if workers > 1 and settings.INVALIDATION_BUS == "local":
+        print("INVALIDATION_BUS=local only reaches one process, using 'postgres' for the workers")
+        os.environ["INVALIDATION_BUS"] = "postgres"
+    print(f"Starting {workers} workers, DB pool per worker: size {pool_size} + overflow {max_overflow}")
+
+    from main import init_database
+    from app.database import engine
+    from app.sharding import dispose_shard_engines
+
+    init_database()
+    # Don't keep the runner's connections open next to the workers' pools
+    dispose_shard_engines()
+    engine.dispose()
+
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=workers, log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+import json
+import os
+import sys
+
+# Settings are read at import time: keep the tests on the in-process bus, off any real listener
+os.environ.setdefault("JWT_SECRET", "test-secret-not-for-production-use-0000")
+os.environ.setdefault("INVALIDATION_BUS", "local")
+
+# Database-backed tests (tests/test_sharding.py) run against two throwaway databases:
+#   TEST_DATABASE_URL=postgresql://postgres@localhost:5432/multitenant_test
+#   TEST_SHARD_DATABASE_URL=postgresql://postgres@localhost:5433/multitenant_test
+if os.environ.get("TEST_DATABASE_URL"):
+    os.environ["DATABASE_URL"] = os.environ["TEST_DATABASE_URL"]
+    if os.environ.get("TEST_SHARD_DATABASE_URL"):
+        os.environ["SHARD_DATABASE_URLS"] = json.dumps({"shard1": os.environ["TEST_SHARD_DATABASE_URL"]})
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,26 @@
+from app.change_feed import RESET, ChangeHub, format_sse, parse_event_id
+
+
+def _event(audit_id):
+    return {"id": audit_id, "tenant": "tenant1", "entity": "resource", "op": "created", "entity_id": audit_id}
+
+
+def _sse_id(event):
+    return format_sse(event).split("\n")[0].removeprefix("id: ")
+
+
+def test_resume_follows_delivery_order_not_audit_ids():
+    hub = ChangeHub()
+    hub._tenant_shards["tenant1"] = "default"
+    events = [_event(i) for i in (5, 6, 8, 7)]
+    for e in events:
+        hub.publish(e)
+    # A client that saw audit id 8 still gets 7, which committed later
+    missed = hub._buffers["tenant1"].since(parse_event_id(_sse_id(events[2])))
+    assert [e["id"] for e in missed] == [7]
+
+
+def test_foreign_event_ids_are_not_resumable():
+    assert parse_event_id("123") is None
+    assert parse_event_id("otherworker-3") is None
+    assert format_sse(RESET).startswith("event: reset")
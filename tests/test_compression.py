@@ -0,0 +1,131 @@
+import gzip
+
+import anyio
+import httpx
+import pytest
+
+from app import compression
+from app.compression import CompressionMiddleware, negotiate_encoding
+
+BODY = b'{"items": [' + b'{"name": "resource"}, ' * 200 + b"]}"
+
+
+@pytest.fixture
+def encoders(monkeypatch):
+    # Pin the available encodings so the results do not depend on brotli / zstandard being installed
+    monkeypatch.setattr(compression, "ENCODERS", {"br": compression._gzip, "gzip": compression._gzip})
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip", "gzip"),
+    ("gzip, br", "br"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("br;q=0.5, gzip;q=0.5", "br"),
+    ("x-gzip", "gzip"),
+    ("*", "br"),
+    ("*;q=0.5, br;q=0", "gzip"),
+    ("gzip;q=0", None),
+    ("deflate, identity", None),
+    ("gzip;q=nope", None),
+    ("", None),
+])
+def test_negotiate_encoding(encoders, header, expected):
+    assert negotiate_encoding(header) == expected
+
+
+async def _get(app, accept_encoding="gzip"):
+    transport = httpx.ASGITransport(app=CompressionMiddleware(app))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.get("/", headers={"Accept-Encoding": accept_encoding})
+
+
+def _app(body=BODY, status=200, headers=()):
+    async def app(scope, receive, send):
+        raw = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *headers]
+        await send({"type": "http.response.start", "status": status, "headers": raw})
+        await send({"type": "http.response.body", "body": body})
+    return app
+
+
+async def _streamed_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+    for i in range(0, len(BODY), 100):
+        await send({"type": "http.response.body", "body": BODY[i:i + 100], "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def _sse_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/event-stream")]})
+    await send({"type": "http.response.body", "body": b"data: x\n\n" * 500})
+
+
+def test_large_response_is_compressed():
+    response = anyio.run(_get, _app())
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(BODY)
+    assert response.content == BODY
+
+
+def test_small_response_is_not_compressed(monkeypatch):
+    monkeypatch.setattr(compression.settings, "COMPRESSION_MIN_SIZE", len(BODY) + 1)
+    response = anyio.run(_get, _app())
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.content == BODY
+
+
+def test_identity_client_gets_vary_only():
+    response = anyio.run(_get, _app(), "identity")
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.content == BODY
+
+
+def test_streamed_chunks_are_compressed(monkeypatch):
+    # Exercise the worker thread path as well
+    monkeypatch.setattr(compression.settings, "COMPRESSION_MIN_SIZE", 500)
+    monkeypatch.setattr(compression.settings, "COMPRESSION_THREAD_MIN_SIZE", 100)
+    sent = []
+
+    async def run():
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", b"gzip")]}
+        await CompressionMiddleware(_streamed_app)(scope, receive, send)
+
+    anyio.run(run)
+    headers = dict(sent[0]["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+    # The first compressed bytes go out while the app is still streaming
+    assert sent[1]["more_body"] is True
+    assert sent[-1].get("more_body", False) is False
+    chunks = [m["body"] for m in sent[1:]]
+    assert gzip.decompress(b"".join(chunks)) == BODY
+
+
+def test_error_response_passes_through():
+    response = anyio.run(_get, _app(status=404))
+    assert response.status_code == 404
+    assert "content-encoding" not in response.headers
+    assert "vary" not in response.headers
+    assert response.content == BODY
+
+
+def test_event_stream_passes_through():
+    response = anyio.run(_get, _sse_app)
+    assert "content-encoding" not in response.headers
+    assert response.content == b"data: x\n\n" * 500
+
+
+def test_etag_is_weakened():
+    response = anyio.run(_get, _app(headers=[(b"etag", b'"abc"')]))
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == 'W/"abc"'
+    response = anyio.run(_get, _app(headers=[(b"etag", b'W/"abc"')]))
+    assert response.headers["etag"] == 'W/"abc"'
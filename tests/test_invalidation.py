@@ -0,0 +1,73 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app import invalidation
+from app.invalidation import FLUSH, LocalInvalidationBus, queue_invalidation
+
+
+@pytest.fixture
+def bus(monkeypatch):
+    b = LocalInvalidationBus()
+    monkeypatch.setattr(invalidation, "bus", b)
+    return b
+
+
+@pytest.fixture
+def session():
+    Session = sessionmaker(bind=create_engine("sqlite://"))
+    with Session() as s:
+        yield s
+
+
+def _write(s):
+    s.execute(text("SELECT 1"))
+
+
+def test_events_are_applied_after_commit(bus, session):
+    seen = []
+    bus.register(seen.append, scopes=("tenant",))
+    _write(session)
+    queue_invalidation(session, "tenant", "tenant1")
+    assert seen == []
+    session.commit()
+    assert seen == [{"scope": "tenant", "tenant": "tenant1", "id": None}]
+
+
+def test_rollback_drops_events(bus, session):
+    seen = []
+    bus.register(seen.append, scopes=("tenant",))
+    _write(session)
+    queue_invalidation(session, "tenant", "tenant1")
+    session.rollback()
+    session.commit()
+    assert seen == []
+
+
+def test_unhandled_scopes_are_not_queued(bus, session):
+    seen = []
+    bus.register(seen.append, scopes=("tenant",))
+    queue_invalidation(session, "resource", "tenant1", 7)
+    assert invalidation._PENDING_KEY not in session.info
+    bus.flush_all()
+    assert seen == [{"scope": FLUSH, "tenant": None, "id": None}]
+
+
+def test_failing_handler_flushes_all_caches(bus, session):
+    seen = []
+
+    def broken(event):
+        if event["scope"] != FLUSH:
+            raise RuntimeError("boom")
+
+    bus.register(broken, scopes=("tenant",))
+    bus.register(seen.append, scopes=("tenant",))
+    _write(session)
+    queue_invalidation(session, "tenant", "tenant1")
+    session.commit()
+    assert seen[-1]["scope"] == FLUSH
+
+
+def test_unknown_scope_is_rejected(bus):
+    with pytest.raises(ValueError):
+        bus.register(lambda event: None, scopes=("tenants",))
@@ -0,0 +1,49 @@
+import anyio
+import httpx
+
+from app import profiler
+from app.auth import create_access_token
+from app.models import RoleEnum
+from app.profiler import RequestProfilerMiddleware
+
+
+def _headers():
+    token = create_access_token(user_id=None, username="superadmin", role=RoleEnum.SUPERADMIN.value, tenant_id="public")
+    return {"X-Profile": "collapsed", "X-Profile-Token": token}
+
+
+async def _get(app):
+    middleware = RequestProfilerMiddleware(app)
+
+    async def asgi(scope, receive, send):
+        # Starlette puts the application in the scope, the profiler reads its routes from there
+        await middleware({**scope, "app": app}, receive, send)
+
+    transport = httpx.ASGITransport(app=asgi)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.get("/", headers=_headers())
+
+
+async def _slow_app(scope, receive, send):
+    await anyio.sleep(30)
+
+
+async def _sse_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/event-stream")]})
+    while True:
+        await send({"type": "http.response.body", "body": b": keepalive\n\n", "more_body": True})
+        await anyio.sleep(0.05)
+
+
+def test_request_profile_is_capped(monkeypatch):
+    monkeypatch.setattr(profiler.settings, "PROFILER_MAX_SECONDS", 0.2)
+    response = anyio.run(_get, _slow_app)
+    assert response.status_code == 200
+    assert response.headers["x-profile-truncated"] == "1"
+    assert not profiler._profile_lock.locked()
+
+
+def test_streaming_responses_are_refused():
+    response = anyio.run(_get, _sse_app)
+    assert response.status_code == 400
+    assert not profiler._profile_lock.locked()
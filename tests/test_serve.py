@@ -0,0 +1,21 @@
+import pytest
+
+import serve
+
+
+def test_pool_sizes_stay_within_budget():
+    pool_size, max_overflow = serve.pool_sizes(90, 4)
+    assert 4 * (pool_size + max_overflow + serve.RESERVED_CONNECTIONS_PER_WORKER) <= 90
+
+
+def test_pool_sizes_rejects_too_many_workers():
+    with pytest.raises(ValueError):
+        serve.pool_sizes(90, 45)
+
+
+@pytest.mark.parametrize("cpus", [1, 8, 44, 128])
+def test_default_workers_fit_the_budget(monkeypatch, cpus):
+    monkeypatch.setattr(serve.os, "cpu_count", lambda: cpus)
+    workers = serve.default_workers(90)
+    assert 1 <= workers <= cpus
+    serve.pool_sizes(90, workers)
@@ -0,0 +1,131 @@
+import os
+import time
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select, text
+
+from app import invalidation, sharding
+from app.crud import create_resource
+from app.config import settings
+from app.database import create_all_tables, db_session, set_search_path, table_exists
+from app.models import Resource, RoleEnum, Tenant, User
+from app.tenant_service import create_tenant, drop_tenant
+
+pytestmark = pytest.mark.skipif(
+    not (os.environ.get("TEST_DATABASE_URL") and os.environ.get("TEST_SHARD_DATABASE_URL")),
+    reason="needs TEST_DATABASE_URL and TEST_SHARD_DATABASE_URL (two local databases)",
+)
+
+SHARD = "shard1"
+
+
+@pytest.fixture(scope="module", autouse=True)
+def registry():
+    create_all_tables()
+
+
+@pytest.fixture
+def tenants():
+    """Create tenants through tenant_service and drop them again afterwards."""
+    created = []
+
+    def _create(schema_name, shard=None):
+        with db_session() as s:
+            set_search_path(s, settings.PUBLIC_SCHEMA)
+            t = create_tenant(s, f"{schema_name} corp", schema_name, shard=shard)
+            created.append(t.id)
+            return t.shard
+
+    yield _create
+    for tenant_id in created:
+        with db_session() as s:
+            set_search_path(s, settings.PUBLIC_SCHEMA)
+            if s.get(Tenant, tenant_id) is not None:
+                drop_tenant(s, tenant_id)
+
+
+def test_tenant_schema_lives_on_its_shard(tenants):
+    assert tenants("shtest_pinned", SHARD) == SHARD
+    assert table_exists("resources", "shtest_pinned", bind=sharding.get_shard_engine(SHARD))
+    assert not table_exists("resources", "shtest_pinned", bind=sharding.get_shard_engine(settings.DEFAULT_SHARD))
+    assert sharding.resolve_tenant_shard("shtest_pinned") == SHARD
+
+    with sharding.tenant_session("shtest_pinned") as s:
+        owner = User(username="owner", password_hash="x", role=RoleEnum.ADMIN)
+        s.add(owner)
+        s.flush()
+        s.add(Resource(name="on shard1", owner_id=owner.id))
+    with sharding.tenant_session("shtest_pinned") as s:
+        assert s.scalar(select(Resource.name)) == "on shard1"
+
+
+def test_least_loaded_placement_fills_the_emptier_shard(tenants):
+    with db_session() as s:
+        set_search_path(s, settings.PUBLIC_SCHEMA)
+        expected = sharding.least_loaded(s, "shtest_auto")
+    assert tenants("shtest_auto") == expected
+
+
+def test_dropped_tenant_is_forgotten(tenants):
+    tenants("shtest_gone", SHARD)
+    sharding.resolve_tenant_shard("shtest_gone")
+    with db_session() as s:
+        set_search_path(s, settings.PUBLIC_SCHEMA)
+        drop_tenant(s, s.scalar(select(Tenant.id).where(Tenant.schema_name == "shtest_gone")))
+    with pytest.raises(HTTPException):
+        sharding.resolve_tenant_shard("shtest_gone")
+
+
+def test_shard_session_survives_engine_eviction(monkeypatch):
+    url = settings.SHARD_DATABASE_URLS[SHARD]
+    monkeypatch.setattr(settings, "SHARD_DATABASE_URLS", {"a": url, "b": url})
+    monkeypatch.setattr(settings, "SHARD_ENGINE_CACHE_SIZE", 1)
+    sharding.dispose_shard_engines()
+    get_engine = sharding.get_shard_engine
+
+    def get_then_evict(shard):
+        eng = get_engine(shard)
+        # Another thread opens the other shard right after, evicting this engine from the cache
+        get_engine("b" if shard == "a" else "a")
+        return eng
+
+    monkeypatch.setattr(sharding, "get_shard_engine", get_then_evict)
+    try:
+        with sharding.shard_session("a") as s:
+            assert s.execute(text("SELECT 1")).scalar() == 1
+    finally:
+        sharding.dispose_shard_engines()
+
+
+def test_resource_invalidation_from_another_shard_reaches_other_workers(tenants, monkeypatch):
+    tenants("shtest_events", SHARD)
+    with sharding.tenant_session("shtest_events") as s:
+        owner = User(username="owner", password_hash="x", role=RoleEnum.ADMIN)
+        s.add(owner)
+        s.flush()
+        owner_id = owner.id
+
+    # `writer` is this process' bus, `other` stands in for another worker's
+    writer, other = invalidation.PostgresInvalidationBus(), invalidation.PostgresInvalidationBus()
+    written, received = [], []
+    writer.register(written.append, scopes=("resource",))
+    other.register(received.append, scopes=("resource",))
+    monkeypatch.setattr(invalidation, "bus", writer)
+    other.start()
+    try:
+        deadline = time.monotonic() + 10
+        while not other.fresh() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert other.fresh()
+
+        with sharding.tenant_session("shtest_events") as s:
+            resource = create_resource(s, "invalidated", None, owner_id, owner_id)
+            resource_id = resource.id
+        event = {"scope": "resource", "tenant": "shtest_events", "id": resource_id}
+        assert written == [event]
+        while event not in received and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert event in received
+    finally:
+        other.stop()
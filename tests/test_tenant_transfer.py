@@ -0,0 +1,111 @@
+import gzip
+import io
+import json
+import os
+import tarfile
+
+import pytest
+from sqlalchemy import select
+
+from app.config import settings
+from app.database import create_all_tables, db_session, set_search_path, table_exists
+from app.models import Tenant
+from app.sharding import get_shard_engine
+from app.tenant_service import create_tenant, drop_tenant
+from app.tenant_transfer import ARCHIVE_FORMAT_VERSION, MANIFEST_NAME, export_tenant, import_tenant, read_manifest
+
+requires_db = pytest.mark.skipif(not os.environ.get("TEST_DATABASE_URL"), reason="needs TEST_DATABASE_URL")
+
+
+def _archive(tmp_path, members: dict) -> str:
+    path = tmp_path / "tenant.tar"
+    with tarfile.open(path, "w") as tar:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return str(path)
+
+
+def _manifest(**overrides) -> bytes:
+    entry = {"table": "users", "file": "users.copy.gz", "columns": ["id", "username"], "rows": 0, "sha256": ""}
+    manifest = {"format_version": ARCHIVE_FORMAT_VERSION, "tables": [{**entry, **overrides}]}
+    return json.dumps(manifest).encode()
+
+
+def test_valid_manifest(tmp_path):
+    path = _archive(tmp_path, {MANIFEST_NAME: _manifest(), "users.copy.gz": b""})
+    assert read_manifest(path)["tables"][0]["table"] == "users"
+
+
+@pytest.mark.parametrize("members", [
+    {MANIFEST_NAME: b"{not json", "users.copy.gz": b""},
+    {"users.copy.gz": b""},
+    {MANIFEST_NAME: b"[]"},
+    {MANIFEST_NAME: _manifest()},
+    {MANIFEST_NAME: _manifest(table="tenants"), "users.copy.gz": b""},
+    {MANIFEST_NAME: _manifest(columns=["id", "password; DROP"]), "users.copy.gz": b""},
+    {MANIFEST_NAME: _manifest(columns=[]), "users.copy.gz": b""},
+])
+def test_bad_archives_raise_value_error(tmp_path, members):
+    with pytest.raises(ValueError):
+        read_manifest(_archive(tmp_path, members))
+
+
+def test_not_a_tar_raises_value_error(tmp_path):
+    path = tmp_path / "garbage.tar"
+    path.write_bytes(b"definitely not a tar file" * 100)
+    with pytest.raises(ValueError):
+        read_manifest(str(path))
+
+
+def test_manifest_directory_raises_value_error(tmp_path):
+    path = tmp_path / "tenant.tar"
+    with tarfile.open(path, "w") as tar:
+        info = tarfile.TarInfo(MANIFEST_NAME)
+        info.type = tarfile.DIRTYPE
+        tar.addfile(info)
+    with pytest.raises(ValueError):
+        read_manifest(str(path))
+
+
+def _replace_member(src: str, dest: str, name: str, data: bytes):
+    with tarfile.open(src, "r") as old, tarfile.open(dest, "w") as new:
+        for member in old.getmembers():
+            body = data if member.name == name else old.extractfile(member).read()
+            member.size = len(body)
+            new.addfile(member, io.BytesIO(body))
+
+
+@pytest.fixture
+def exported_tenant(tmp_path):
+    create_all_tables()
+    with db_session() as s:
+        set_search_path(s, settings.PUBLIC_SCHEMA)
+        t = create_tenant(s, "transfer corp", "xfer_source", shard=settings.DEFAULT_SHARD)
+        tenant_id = t.id
+    path = str(tmp_path / "source.tar")
+    export_tenant("xfer_source", settings.DEFAULT_SHARD, path)
+    yield path
+    with db_session() as s:
+        set_search_path(s, settings.PUBLIC_SCHEMA)
+        drop_tenant(s, tenant_id)
+
+
+@requires_db
+@pytest.mark.parametrize("data", [
+    b"\x1f\x8b not really gzip",
+    gzip.compress(b"1\tonly one column\n")[:-6],
+    gzip.compress(b"not-a-number\tname\thash\tADMIN\tf\n"),
+])
+def test_corrupt_table_data_raises_value_error(exported_tenant, tmp_path, data):
+    corrupt = str(tmp_path / "corrupt.tar")
+    _replace_member(exported_tenant, corrupt, "users.copy.gz", data)
+    with db_session() as s:
+        set_search_path(s, settings.PUBLIC_SCHEMA)
+        with pytest.raises(ValueError):
+            import_tenant(s, corrupt, "corrupt corp", "xfer_corrupt", shard=settings.DEFAULT_SHARD)
+        s.rollback()
+        assert s.scalar(select(Tenant.id).where(Tenant.schema_name == "xfer_corrupt")) is None
+    # The half-imported schema is dropped again
+    assert not table_exists("users", "xfer_corrupt", bind=get_shard_engine(settings.DEFAULT_SHARD))